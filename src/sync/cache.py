@@ -1,6 +1,10 @@
 import abc
+import contextlib
 import logging
+import os
 import pickle
+import sqlite3
+import threading
 
 LOGGER = logging.getLogger(__name__)
 
@@ -108,3 +112,110 @@ class InMemoryCacheWithStorage(InMemoryCache):
             LOGGER.warning(
                 'unable to load cache from "%s" due to "%s"', self.storage_path, exc
             )
+
+
+class SqliteCache(CacheBase):
+    """
+    Cache persisted into SQLite database. Unlike InMemoryCacheWithStorage,
+    entries are written as they are set, so nothing is lost if the process is
+    interrupted and there is no need to rewrite everything at the end.
+    """
+
+    def __init__(self, storage_path: str):
+        self.storage_path = storage_path
+        # cache is shared by provider clones which work in parallel
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def load(self):
+        LOGGER.debug('opening cache database "%s"', self.storage_path)
+        self.close()
+        try:
+            connection = sqlite3.connect(
+                self.storage_path, isolation_level=None, check_same_thread=False
+            )
+            try:
+                # every statement is committed on its own, WAL mode makes that
+                # cheap as there is no fsync per commit with normal sync level
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries "
+                    "(key TEXT PRIMARY KEY, value BLOB) WITHOUT ROWID"
+                )
+                # damaged pages are otherwise only noticed once they are read
+                problems = connection.execute("PRAGMA quick_check").fetchall()
+                if problems != [("ok",)]:
+                    raise CacheCorruptedError(
+                        f'cache database "{self.storage_path}" is corrupted: '
+                        + "; ".join(problem for (problem,) in problems)
+                    )
+            except Exception:
+                connection.close()
+                raise
+        except sqlite3.OperationalError:
+            # e.g. database is locked or can not be opened at all, which says
+            # nothing about its content
+            raise
+        except sqlite3.DatabaseError as exc:
+            raise CacheCorruptedError(
+                f'cache database "{self.storage_path}" is corrupted'
+            ) from exc
+        self._connection = connection
+
+    def try_load(self):
+        try:
+            self.load()
+        except CacheCorruptedError as exc:
+            LOGGER.warning(
+                'unable to load cache from "%s" due to "%s", recreating...',
+                self.storage_path,
+                exc,
+            )
+            self.close()
+            # WAL side files belong to the corrupted database, if left behind
+            # these could be replayed against the new one
+            for path in [
+                self.storage_path,
+                self.storage_path + "-wal",
+                self.storage_path + "-shm",
+            ]:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+            try:
+                self.load()
+            except Exception as exc:
+                LOGGER.warning(
+                    'unable to recreate cache at "%s" due to "%s"',
+                    self.storage_path,
+                    exc,
+                )
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _execute(self, sql: str, parameters=()) -> list:
+        with self._lock:
+            if self._connection is None:
+                self.load()
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def get(self, key: str) -> PrimitiveType | CacheMissSentinel:
+        rows = self._execute("SELECT value FROM entries WHERE key = ?", (key,))
+        if not rows:
+            return CACHE_MISS
+        return pickle.loads(rows[0][0])
+
+    def set(self, key: str, value: PrimitiveType) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO entries (key, value) VALUES (?, ?)",
+            (key, pickle.dumps(value)),
+        )
+
+    def delete(self, key: str) -> None:
+        self._execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._execute("DELETE FROM entries")
@@ -9,7 +9,7 @@ from typing import List, Optional
 
 import coloredlogs
 
-from sync.cache import InMemoryCacheWithStorage
+from sync.cache import SqliteCache
 from sync.core import Syncer
 from sync.provider import ProviderBase
 from sync.providers.dropbox import DropboxProvider
@@ -18,7 +18,7 @@ from sync.providers.sftp import STFPProvider
 
 LOGGER = logging.getLogger("cli")
 
-CACHES: List[InMemoryCacheWithStorage] = []
+CACHES: List[SqliteCache] = []
 
 
 def main(
@@ -41,10 +41,10 @@ def main(
     try:
         syncer.sync(dry_run=dry_run)
     finally:
-        # flush caches to disk
-        LOGGER.debug("flushing caches...")
+        LOGGER.debug("closing caches...")
         for cache in CACHES:
-            cache.try_save()
+            cache.close()
+        CACHES.clear()
 
 
 def parse_args(args: List[str]):
@@ -65,22 +65,29 @@ def init_provider(args: List[str]):
             raise Exception("expected %s for %s provider" % (param, provider_type))
         return provider_args.pop(param, None)
 
-    if provider_type == "FS":
+    def attach_cache(provider):
         cache_dir = get("cache_dir", required=False)
         cache_dir = cache_dir or ".cache"
 
         if not os.path.exists(cache_dir):
-            LOGGER.info('creating cache dir for FS provider at "%s"...', cache_dir)
+            LOGGER.info(
+                'creating cache dir for %s provider at "%s"...',
+                provider_type,
+                cache_dir,
+            )
             os.makedirs(cache_dir)
 
-        provider = FSProvider(
-            root_dir=get("root"),
-        )
-        cache_path = os.path.join(cache_dir, provider.get_handle())
-        cache = InMemoryCacheWithStorage(cache_path)
+        cache_path = os.path.join(cache_dir, provider.get_handle() + ".sqlite")
+        cache = SqliteCache(cache_path)
         provider.cache = cache
         cache.try_load()
         CACHES.append(cache)
+
+    if provider_type == "FS":
+        provider = FSProvider(
+            root_dir=get("root"),
+        )
+        attach_cache(provider)
     elif provider_type == "D":
         account_id = get("id")
         access_token = get("access_token", required=False)
@@ -105,6 +112,7 @@ def init_provider(args: List[str]):
             root_dir=get("root"),
             **dropbox_args,
         )
+        attach_cache(provider)
     elif provider_type == "SFTP":
         provider = STFPProvider(
             host=get("host"),
@@ -114,6 +122,7 @@ def init_provider(args: List[str]):
             password=get("pass", required=False),
             port=int(get("port", required=False) or 22),
         )
+        attach_cache(provider)
     else:
         raise Exception('unknown provider: "%s"' % provider_type)
 
@@ -123,7 +132,7 @@ def init_provider(args: List[str]):
     return provider
 
 
-def entrypoint():
+def entrypoint(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(
         description="""
 Provider options have to be passed in "key=value" format.
@@ -134,11 +143,13 @@ For example:
 Supported providers:
 
 FS - File system
-    root: Path to the root directory (e.g. "/data/backup")
+    root:       Path to the root directory (e.g. "/data/backup")
+    cache_dir:  Optional path to the cache directory (".cache" is default)
     
 D - Dropbox
     root:           Path to the root directory (e.g. "/data")
     id:             User arbitrary ID for account (e.g. "personal")
+    cache_dir:      Optional path to the cache directory (".cache" is default)
     
     Authentication options (one of the two):
         access_token:   Optional access token
@@ -148,11 +159,12 @@ D - Dropbox
         app_secret:     Optional APP secret
         
 SFTP - SFTP (POSIX hosts only)
-    host:   ip or hostname of the target machine
-    root:   Path to the root directory
-    key:    Optional path to the key file
-    pass:   Optional password
-    port:   Optional port number (22 is default)
+    host:       ip or hostname of the target machine
+    root:       Path to the root directory
+    key:        Optional path to the key file
+    pass:       Optional password
+    port:       Optional port number (22 is default)
+    cache_dir:  Optional path to the cache directory (".cache" is default)
 """,
         formatter_class=RawTextHelpFormatter,
     )
@@ -188,7 +200,7 @@ Examples:
         "--state-dir", type=str, default=".state", help="Location of the state files."
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     coloredlogs.install(
         level=logging.getLevelName(args.log_level.upper()),
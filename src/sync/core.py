@@ -46,6 +46,9 @@ class SyncAction(abc.ABC):
             return False
         return self.path == other.path
 
+    def __hash__(self):
+        return hash(self.path)
+
 
 # download means from DESTINATION to SOURCE
 class DownloadSyncAction(SyncAction):
@@ -87,6 +90,9 @@ class MoveOnSourceSyncAction(SyncAction):
             return False
         return self.path == other.path and self.new_path == other.new_path
 
+    def __hash__(self):
+        return hash((self.path, self.new_path))
+
 
 class MoveOnDestinationSyncAction(SyncAction):
     TYPE = "MOVE_DST"
@@ -106,6 +112,9 @@ class MoveOnDestinationSyncAction(SyncAction):
             return False
         return self.path == other.path and self.new_path == other.new_path
 
+    def __hash__(self):
+        return hash((self.path, self.new_path))
+
 
 class NoopSyncAction(SyncAction):
     TYPE = "NOOP"
@@ -119,6 +128,16 @@ class RaiseErrorSyncAction(SyncAction):
         self.message = message
 
 
+# actions which are applied in batches as providers can remove or move many
+# files at once
+BATCHED_ACTION_TYPES = (
+    RemoveOnSourceSyncAction,
+    RemoveOnDestinationSyncAction,
+    MoveOnSourceSyncAction,
+    MoveOnDestinationSyncAction,
+)
+
+
 class SyncError(Exception):
     pass
 
@@ -237,8 +256,11 @@ def compare_files(
         dst_hash = compute_hash(dst_state, dst_provider)
     else:  # download and compute locally
         LOGGER.debug("no shared hashes, download both and compare locally")
-        src_hash = hash_stream(src_provider.read(src_state.path))
-        dst_hash = hash_stream(dst_provider.read(dst_state.path))
+        # streams may hold remote handles (e.g. SFTP), so release them right away
+        with src_provider.read(src_state.path) as stream:
+            src_hash = hash_stream(stream)
+        with dst_provider.read(dst_state.path) as stream:
+            dst_hash = hash_stream(stream)
 
     LOGGER.debug('source hash "%s", destination hash "%s"', src_hash, dst_hash)
 
@@ -511,6 +533,10 @@ class Syncer:
             action_executor = get_thread_executor()
             action_executor.execute(action)
 
+        def run_batch(batch: List[SyncAction]) -> None:
+            action_executor = get_thread_executor()
+            action_executor.execute_batch(batch)
+
         sync_errors = []
 
         def run_action_wrapped(action: SyncAction):
@@ -522,6 +548,21 @@ class Syncer:
                     "Error happened applying action %s: %s", action, exc, exc_info=True
                 )
 
+        def run_batch_wrapped(batch: List[SyncAction]):
+            try:
+                run_batch(batch)
+            except Exception as exc:
+                sync_errors.append(exc)
+                LOGGER.error(
+                    "Error happened applying %d %s actions: %s",
+                    len(batch),
+                    batch[0].TYPE,
+                    exc,
+                    exc_info=True,
+                )
+
+        batches: Dict[type, List[SyncAction]] = {}
+
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self.threads, thread_name_prefix="worker"
         ) as executor:
@@ -530,8 +571,14 @@ class Syncer:
                 if dry_run:
                     LOGGER.info("would apply %s", action)
                     continue
+                if isinstance(action, BATCHED_ACTION_TYPES):
+                    batches.setdefault(type(action), []).append(action)
+                    continue
                 futures.append(executor.submit(run_action_wrapped, action))
 
+            for batch in batches.values():
+                futures.append(executor.submit(run_batch_wrapped, batch))
+
             try:
                 # wait for all actions to run to completion
                 # this explicit wait is needed in order to support the interruption
@@ -641,6 +688,54 @@ class ActionExecutor:
             LOGGER.debug('writing file at "%s"', path)
             provider.write(path, stream)
 
+    @staticmethod
+    def __remove_many(
+        provider: ProviderBase,
+        state: StorageState,
+        actions: List[SyncAction],
+    ):
+        provider.remove_many([state.files[action.path].path for action in actions])
+        for action in actions:
+            state.files.pop(action.path)
+
+    @staticmethod
+    def __move_many(
+        provider: ProviderBase,
+        state: StorageState,
+        other_state: StorageState,
+        actions: List[SyncAction],
+    ):
+        provider.move_many(
+            [
+                (state.files[action.path].path, other_state.files[action.new_path].path)
+                for action in actions
+            ]
+        )
+        for action in actions:
+            state.files[action.new_path] = state.files.pop(action.path)
+
+    def execute_batch(self, actions: List[SyncAction]):
+        """
+        Applies actions of the same type at once, so that providers are able
+        to remove or move many files in a few requests.
+        """
+        for action in actions:
+            LOGGER.info("apply %s", action)
+
+        action_type = type(actions[0])
+        assert all(type(action) is action_type for action in actions)
+
+        if action_type is RemoveOnDestinationSyncAction:
+            self.__remove_many(self.dst_provider, self.dst_state, actions)
+        elif action_type is RemoveOnSourceSyncAction:
+            self.__remove_many(self.src_provider, self.src_state, actions)
+        elif action_type is MoveOnSourceSyncAction:
+            self.__move_many(self.src_provider, self.src_state, self.dst_state, actions)
+        elif action_type is MoveOnDestinationSyncAction:
+            self.__move_many(self.dst_provider, self.dst_state, self.src_state, actions)
+        else:
+            raise NotImplementedError(f"batch of {action_type.__name__}")
+
     def execute(self, action: SyncAction):
         LOGGER.info("apply %s", action)
 
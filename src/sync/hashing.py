@@ -3,6 +3,7 @@ from hashlib import sha256
 import io
 import json
 import logging
+import threading
 from typing import Any, BinaryIO, Dict
 
 LOGGER = logging.getLogger(__name__)
@@ -13,13 +14,56 @@ class HashType(StrEnum):
     SHA256 = "SHA256"
 
 
-def sha256_stream(stream: BinaryIO, buffer_size: int = 1024) -> str:
-    sha = sha256()
-    while True:
-        buffer = stream.read(buffer_size)
-        if not buffer:
+# large reads reduce amount of Python level iterations and let hashlib
+# process longer runs of data per call
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# Dropbox content hash is defined over blocks of exactly that size
+DROPBOX_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+# read buffers are reused by every thread to avoid allocation per chunk
+_THREAD_LOCAL = threading.local()
+
+
+def _get_buffer(size: int) -> bytearray:
+    buffers = getattr(_THREAD_LOCAL, "buffers", None)
+    if buffers is None:
+        buffers = _THREAD_LOCAL.buffers = {}
+    buffer = buffers.get(size)
+    if buffer is None:
+        buffer = buffers[size] = bytearray(size)
+    return buffer
+
+
+def _read_block(stream: BinaryIO, view: memoryview) -> int:
+    # readinto is allowed to return less than requested even before the end
+    # of the stream, while Dropbox hash relies on blocks being filled up
+    size = 0
+    while size < len(view):
+        read = stream.readinto(view[size:])
+        if not read:
             break
-        sha.update(buffer)
+        size += read
+    return size
+
+
+def sha256_stream(stream: BinaryIO, buffer_size: int = DEFAULT_BUFFER_SIZE) -> str:
+    sha = sha256()
+
+    if not hasattr(stream, "readinto"):
+        while True:
+            buffer = stream.read(buffer_size)
+            if not buffer:
+                break
+            sha.update(buffer)
+        return sha.hexdigest()
+
+    buffer = _get_buffer(buffer_size)
+    with memoryview(buffer) as view:
+        while True:
+            size = stream.readinto(buffer)
+            if not size:
+                break
+            sha.update(view[:size])
     return sha.hexdigest()
 
 
@@ -38,14 +82,21 @@ def hash_dict(data: Dict[str, Any]) -> str:
 
 
 def dropbox_hash_stream(stream: BinaryIO) -> str:
-    with io.BytesIO() as hash_buffer:
+    block_hashes = sha256()
+
+    if not hasattr(stream, "readinto"):
         while True:
-            block = stream.read(4 * 1024 * 1024)
+            block = stream.read(DROPBOX_HASH_BLOCK_SIZE)
             if not block:
                 break
-            with io.BytesIO(block) as block_stream:
-                block_hash_bytes = bytes.fromhex(sha256_stream(block_stream))
-                hash_buffer.write(block_hash_bytes)
-        hash_buffer.seek(0)
-        result_hash = sha256_stream(hash_buffer)
-        return result_hash
+            block_hashes.update(sha256(block).digest())
+        return block_hashes.hexdigest()
+
+    buffer = _get_buffer(DROPBOX_HASH_BLOCK_SIZE)
+    with memoryview(buffer) as view:
+        while True:
+            size = _read_block(stream, view)
+            if not size:
+                break
+            block_hashes.update(sha256(view[:size]).digest())
+    return block_hashes.hexdigest()
@@ -1,5 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import BinaryIO, List
+from typing import (
+    BinaryIO,
+    Iterable,
+    List,
+    Tuple,
+)
 
 from sync.hashing import HashType
 from sync.state import FileState, StorageState
@@ -60,6 +65,15 @@ class ProviderBase(ABC):
     def write(self, path: str, content: BinaryIO) -> None:
         raise NotImplementedError
 
+    def write_many(self, items: Iterable[Tuple[str, BinaryIO]]) -> None:
+        """
+        Writes multiple files given as (path, content) pairs. Providers which
+        can do that in fewer round-trips override it, by default files are
+        written one by one.
+        """
+        for path, content in items:
+            self.write(path, content)
+
     @abstractmethod
     def remove_file(self, path: str) -> None:
         raise NotImplementedError
@@ -68,10 +82,25 @@ class ProviderBase(ABC):
     def remove_folder(self, path: str) -> None:
         raise NotImplementedError
 
+    def remove_many(self, paths: Iterable[str]) -> None:
+        """
+        Removes multiple files, by default one by one.
+        """
+        for path in paths:
+            self.remove_file(path)
+
     @abstractmethod
     def move(self, source_path: str, destination_path: str) -> None:
         raise NotImplementedError
 
+    def move_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """
+        Moves multiple files given as (source, destination) pairs, by default
+        one by one.
+        """
+        for source_path, destination_path in items:
+            self.move(source_path, destination_path)
+
     @abstractmethod
     def supported_hash_types(self) -> List[HashType]:
         raise NotImplementedError
@@ -68,6 +68,10 @@ def normalize_path(path: str, case_insensitive: bool = False) -> str:
     path = normalize_unicode(path)
 
     if case_insensitive:
-        path = path.lower()
+        lowered_path = path.lower()
+        # str.lower always allocates a new string, keep the original one when
+        # nothing changed, so that state keys share memory with file states
+        if lowered_path != path:
+            path = lowered_path
 
     return path
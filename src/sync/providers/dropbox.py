@@ -1,13 +1,33 @@
+import concurrent.futures
 import io
 import logging
+import threading
 import time
-from typing import BinaryIO, List, Optional
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
 import uuid
 
 import dropbox
 from dropbox.exceptions import ApiError
-from dropbox.files import FileMetadata, FolderMetadata, WriteMode
+from dropbox.files import (
+    CommitInfo,
+    DeleteArg,
+    DeletedMetadata,
+    FileMetadata,
+    FolderMetadata,
+    RelocationPath,
+    UploadSessionCursor,
+    UploadSessionType,
+    WriteMode,
+)
 
+from sync.cache import CACHE_MISS, CacheBase, InMemoryCache
 from sync.hashing import HashType, hash_dict
 from sync.provider import (
     ConflictError,
@@ -22,7 +42,25 @@ from sync.providers.common import normalize_unicode, path_join, relative_path
 from sync.state import FileState, StorageState
 
 LOGGER = logging.getLogger(__name__)
-LISTING_LIMIT = 1000
+# maximum page size allowed by the API
+LISTING_LIMIT = 2000
+# files bigger than a single chunk are uploaded using concurrent upload
+# session; all the chunks except the last one must be a multiple of 4 MiB
+UPLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+UPLOAD_THREADS = 4
+# maximum amount of entries allowed for a single batch request
+BATCH_LIMIT = 1000
+# batch jobs which were not completed right away are polled for completion
+BATCH_POLL_INTERVAL = 0.5
+# connections are reused across clones which work in parallel, so the pool has
+# to be large enough not to drop them
+HTTP_POOL_SIZE = 32
+# cache key for the last full recursive listing along with its cursor
+LISTING_CACHE_KEY = "listing"
+# clients by credentials, so that providers sharing the same credentials (e.g.
+# source and destination accounts) do not exchange refresh token again
+_CLIENTS: Dict[Tuple, dropbox.Dropbox] = {}
+_CLIENTS_LOCK = threading.Lock()
 
 
 class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
@@ -36,6 +74,7 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
         is_refresh_token=False,
         app_key: Optional[str] = None,
         app_secret: Optional[str] = None,
+        cache: CacheBase = None,
     ):
         self.account_id = account_id
         self.root_dir = root_dir
@@ -43,7 +82,9 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
         self.is_refresh_token = is_refresh_token
         self.app_key = app_key
         self.app_secret = app_secret
+        self.cache = cache or InMemoryCache()
         self._dropbox = None
+        self._session = None
 
     def get_label(self) -> str:
         return "DBX(%s)" % self.root_dir
@@ -61,16 +102,33 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
         # https://www.dropboxforum.com/t5/Dropbox-API-Support-Feedback/Case-Sensitivity-in-API-2/td-p/191279
         return False
 
+    def _get_session(self):
+        if self._session is None:
+            self._session = dropbox.create_session(max_connections=HTTP_POOL_SIZE)
+        return self._session
+
     def _get_dropbox(self) -> dropbox.Dropbox:
         if self._dropbox is None:
-            if not self.is_refresh_token:
-                self._dropbox = dropbox.Dropbox(oauth2_access_token=self.token)
-            else:
-                self._dropbox = dropbox.Dropbox(
-                    oauth2_refresh_token=self.token,
-                    app_key=self.app_key,
-                    app_secret=self.app_secret,
-                )
+            key = (self.token, self.is_refresh_token, self.app_key, self.app_secret)
+            with _CLIENTS_LOCK:
+                client = _CLIENTS.get(key)
+                if client is not None:
+                    # carries over access token obtained by another provider
+                    self._dropbox = client.clone(session=self._get_session())
+                elif not self.is_refresh_token:
+                    self._dropbox = dropbox.Dropbox(
+                        oauth2_access_token=self.token,
+                        session=self._get_session(),
+                    )
+                else:
+                    self._dropbox = dropbox.Dropbox(
+                        oauth2_refresh_token=self.token,
+                        app_key=self.app_key,
+                        app_secret=self.app_secret,
+                        session=self._get_session(),
+                    )
+                if client is None:
+                    _CLIENTS[key] = self._dropbox
         assert self._dropbox is not None
         return self._dropbox
 
@@ -85,29 +143,40 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
             return ""  # by Dropbox convention
         return dir_path
 
-    def _ensure_root_dir(self, dbx: dropbox.Dropbox):
-        try:
-            dbx.files_list_folder(self.__dir(self.root_dir), limit=1)
-        except ApiError as err:
-            if "not_found" in str(err):
-                LOGGER.info("root directory was not found -> create")
-                dbx.files_create_folder_v2(self.root_dir)
-
-    def _list_folder(self, dbx: dropbox.Dropbox, path: str, recursive: bool = False):
-        LOGGER.debug("listing folder %s (recursive? %s)", path, recursive)
-        entries = []
-        list_result = dbx.files_list_folder(
-            self.__dir(path), recursive=recursive, limit=LISTING_LIMIT
-        )
+    @staticmethod
+    def _collect_listing(dbx: dropbox.Dropbox, list_result) -> Tuple[list, str]:
         LOGGER.debug("retrieved %s entries", len(list_result.entries))
-        entries.extend(list_result.entries)
+        entries = list(list_result.entries)
         while list_result.has_more:
             list_result = dbx.files_list_folder_continue(list_result.cursor)
             LOGGER.debug(
                 "retrieved %s entries (continuation)", len(list_result.entries)
             )
             entries.extend(list_result.entries)
-        return entries
+        return entries, list_result.cursor
+
+    def _list_folder(
+        self, dbx: dropbox.Dropbox, path: str, recursive: bool = False
+    ) -> Tuple[list, str]:
+        LOGGER.debug("listing folder %s (recursive? %s)", path, recursive)
+        list_result = dbx.files_list_folder(
+            self.__dir(path), recursive=recursive, limit=LISTING_LIMIT
+        )
+        return self._collect_listing(dbx, list_result)
+
+    def _list_root_folder(
+        self, dbx: dropbox.Dropbox, recursive: bool = False
+    ) -> Tuple[list, Optional[str]]:
+        # listing root directory right away instead of checking its existence
+        # first saves a round-trip for every state retrieval
+        try:
+            return self._list_folder(dbx, self.root_dir, recursive=recursive)
+        except ApiError as err:
+            if "not_found" not in str(err):
+                raise
+            LOGGER.info("root directory was not found -> create")
+            dbx.files_create_folder_v2(self.root_dir)
+            return [], None
 
     def _file_metadata_to_file_state(self, entry: FileMetadata):
         full_path = entry.path_display
@@ -129,39 +198,82 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
         ), 'Full path outside of root dir (%s): "%s"' % (self.root_dir, full_path)
 
     def __get_state_walking(self, max_depth: int):
+        if max_depth < 1:
+            return StorageState({})
+
         dbx = self._get_dropbox()
         files = {}
 
-        def walk(path: str, depth: int):
-            if depth > max_depth:
-                return
-
-            for entry in self._list_folder(dbx, path):
+        def walk(entries: list, depth: int):
+            for entry in entries:
                 if isinstance(entry, FileMetadata):
-                    full_path = entry.path_display
-                    self.__ensure_inside_root(full_path)
-                    rel_path = relative_path(full_path, self.root_dir)
-                    files[rel_path] = self._file_metadata_to_file_state(entry)
-                elif isinstance(entry, FolderMetadata):
-                    walk(entry.path_display, depth + 1)
-
-        self._ensure_root_dir(dbx)
-        walk(self.root_dir, depth=1)
+                    file_state = self._file_metadata_to_file_state(entry)
+                    files[file_state.path] = file_state
+                elif isinstance(entry, FolderMetadata) and depth < max_depth:
+                    folder_entries, _ = self._list_folder(dbx, entry.path_display)
+                    walk(folder_entries, depth + 1)
+
+        root_entries, _ = self._list_root_folder(dbx)
+        walk(root_entries, depth=1)
         return StorageState(files)
 
     def __get_state(self):
         dbx = self._get_dropbox()
-        files = {}
-        self._ensure_root_dir(dbx)
 
-        for entry in self._list_folder(dbx, self.root_dir, recursive=True):
+        # previous listing is kept along with the cursor, so that only changes
+        # since then are requested instead of listing everything again
+        listing = self.cache.get(LISTING_CACHE_KEY)
+
+        if listing is not CACHE_MISS:
+            try:
+                LOGGER.debug("continuing listing from the cached cursor")
+                entries, cursor = self._collect_listing(
+                    dbx, dbx.files_list_folder_continue(listing["cursor"])
+                )
+                files = listing["files"]
+            except ApiError as err:
+                LOGGER.warning("unable to continue listing (%s) -> list all", err)
+                listing = CACHE_MISS
+
+        if listing is CACHE_MISS:
+            entries, cursor = self._list_root_folder(dbx, recursive=True)
+            files = {}
+
+        # files are keyed by lower-cased path as deletions are reported with
+        # the casing which does not necessarily match the original one
+        for entry in entries:
             if isinstance(entry, FileMetadata):
-                full_path = entry.path_display
-                self.__ensure_inside_root(full_path)
-                rel_path = relative_path(full_path, self.root_dir)
-                files[rel_path] = self._file_metadata_to_file_state(entry)
+                file_state = self._file_metadata_to_file_state(entry)
+                files[relative_path(entry.path_lower, self.root_dir)] = (
+                    file_state.path,
+                    file_state.content_hash,
+                    file_state.revision,
+                )
+            elif isinstance(entry, DeletedMetadata):
+                if entry.path_lower == self.root_dir.rstrip("/").lower():
+                    files.clear()
+                    continue
+                deleted_path = relative_path(entry.path_lower, self.root_dir)
+                if files.pop(deleted_path, None) is None:
+                    # must have been a folder
+                    folder_prefix = deleted_path + "/"
+                    for path in [p for p in files if p.startswith(folder_prefix)]:
+                        del files[path]
 
-        return StorageState(files)
+        if cursor is not None:
+            self.cache.set(LISTING_CACHE_KEY, {"cursor": cursor, "files": files})
+
+        return StorageState(
+            {
+                path: FileState(
+                    path=path,
+                    content_hash=content_hash,
+                    hash_type=HashType.DROPBOX_SHA256,
+                    revision=revision,
+                )
+                for path, content_hash, revision in files.values()
+            }
+        )
 
     def get_state(self, depth: int | None = None) -> StorageState:
         if depth is not None:
@@ -196,18 +308,90 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
                 ) from err
             raise
 
+    @staticmethod
+    def _upload(
+        dbx: dropbox.Dropbox, full_path: str, content: BinaryIO, mode: WriteMode
+    ) -> None:
+        chunk = content.read(UPLOAD_CHUNK_SIZE)
+        next_chunk = content.read(UPLOAD_CHUNK_SIZE)
+
+        if not next_chunk:
+            dbx.files_upload(chunk, full_path, mode=mode)
+            return
+
+        LOGGER.debug('uploading "%s" using concurrent upload session', full_path)
+
+        session = dbx.files_upload_session_start(
+            b"", session_type=UploadSessionType.concurrent
+        )
+        offset = 0
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=UPLOAD_THREADS, thread_name_prefix="uploader"
+        ) as executor:
+            pending = []
+            while chunk:
+                pending.append(
+                    executor.submit(
+                        dbx.files_upload_session_append_v2,
+                        chunk,
+                        UploadSessionCursor(session.session_id, offset),
+                        # session has to be closed with the last chunk
+                        close=not next_chunk,
+                    )
+                )
+                offset += len(chunk)
+                chunk, next_chunk = next_chunk, content.read(UPLOAD_CHUNK_SIZE)
+
+                # limit amount of chunks held in memory
+                if len(pending) >= UPLOAD_THREADS:
+                    pending.pop(0).result()
+
+            for future in pending:
+                future.result()
+
+        dbx.files_upload_session_finish(
+            b"",
+            UploadSessionCursor(session.session_id, offset),
+            CommitInfo(path=full_path, mode=mode),
+        )
+
+    @staticmethod
+    def _check_batch_result(operation: str, paths: List[str], entries) -> None:
+        failed_paths = [
+            path for path, entry in zip(paths, entries) if entry.is_failure()
+        ]
+
+        if failed_paths:
+            raise ProviderError(
+                "Unable to %s %d entries: %s"
+                % (operation, len(failed_paths), ", ".join(failed_paths))
+            )
+
+    @staticmethod
+    def _wait_for_batch_job(launch, check_job):
+        if launch.is_complete():
+            return launch.get_complete()
+
+        job_id = launch.get_async_job_id()
+        while True:
+            status = check_job(job_id)
+            if status.is_complete():
+                return status.get_complete()
+            if not status.is_in_progress():
+                raise ProviderError("Batch job %s failed: %s" % (job_id, status))
+            time.sleep(BATCH_POLL_INTERVAL)
+
     def write(self, path: str, content: BinaryIO) -> None:
         dbx = self._get_dropbox()
         full_path = self._get_full_path(path)
-        file_bytes = content.read()
-        dbx.files_upload(file_bytes, full_path, mode=WriteMode.overwrite)
+        self._upload(dbx, full_path, content, WriteMode.overwrite)
 
     def update(self, path: str, content: BinaryIO, revision: str) -> None:
         dbx = self._get_dropbox()
         full_path = self._get_full_path(path)
-        file_bytes = content.read()
         try:
-            dbx.files_upload(file_bytes, full_path, mode=WriteMode.update(revision))
+            self._upload(dbx, full_path, content, WriteMode.update(revision))
         except ApiError as err:
             raise ConflictError(
                 f'Can not update "{path}" due to conflict as revision tag does '
@@ -238,6 +422,57 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
                 ) from err
             raise
 
+    def remove_many(self, paths: Iterable[str]) -> None:
+        """
+        Removes multiple files or folders using batch requests, which takes
+        a round-trip per up to a thousand entries instead of one per entry.
+        """
+        dbx = self._get_dropbox()
+        full_paths = [self._get_full_path(path) for path in paths]
+
+        for batch_start in range(0, len(full_paths), BATCH_LIMIT):
+            batch = full_paths[batch_start : batch_start + BATCH_LIMIT]
+            LOGGER.debug("removing batch of %d entries", len(batch))
+            result = self._wait_for_batch_job(
+                dbx.files_delete_batch([DeleteArg(path) for path in batch]),
+                dbx.files_delete_batch_check,
+            )
+            self._check_batch_result("remove", batch, result.entries)
+
+    def move_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """
+        Moves multiple files using batch requests. Moves which need special
+        handling (see "move") are done one by one.
+        """
+        dbx = self._get_dropbox()
+        relocations = []
+
+        for source_path, destination_path in items:
+            source_full_path = self._get_full_path(source_path)
+            destination_full_path = self._get_full_path(destination_path)
+
+            # no-op and case-only moves
+            if (
+                normalize_unicode(source_full_path).lower()
+                == normalize_unicode(destination_full_path).lower()
+            ):
+                self.move(source_path, destination_path)
+            else:
+                relocations.append(
+                    RelocationPath(source_full_path, destination_full_path)
+                )
+
+        for batch_start in range(0, len(relocations), BATCH_LIMIT):
+            batch = relocations[batch_start : batch_start + BATCH_LIMIT]
+            LOGGER.debug("moving batch of %d entries", len(batch))
+            result = self._wait_for_batch_job(
+                dbx.files_move_batch_v2(batch),
+                dbx.files_move_batch_check_v2,
+            )
+            self._check_batch_result(
+                "move", [entry.from_path for entry in batch], result.entries
+            )
+
     @staticmethod
     def __move_wrapped(dbx: dropbox.Dropbox, src_path: str, dst_path: str):
         attempt = 0
@@ -315,14 +550,21 @@ class DropboxProvider(ProviderBase, SafeUpdateSupportMixin):
         return result.content_hash
 
     def clone(self) -> "ProviderBase":
-        return DropboxProvider(
+        cloned = DropboxProvider(
             self.account_id,
             self.token,
             self.root_dir,
             self.is_refresh_token,
             self.app_key,
             self.app_secret,
+            self.cache,
         )
+        # share connection pool, so that clones do not redo TLS handshakes
+        cloned._session = self._get_session()
+        if self._dropbox is not None:
+            # carries over access token, so that clones do not refresh it again
+            cloned._dropbox = self._dropbox.clone(session=cloned._session)
+        return cloned
 
     def close(self):
         # nothing to close
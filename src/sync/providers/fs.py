@@ -1,6 +1,11 @@
+import concurrent.futures
+import contextlib
+from hashlib import sha256
+import io
 import logging
 import os.path
 import shutil
+from stat import S_ISREG
 import tempfile
 from typing import BinaryIO, List
 
@@ -27,8 +32,14 @@ LOGGER = logging.getLogger(__name__)
 
 
 class FSProvider(ProviderBase, SafeUpdateSupportMixin):
-    BUFFER_SIZE = 4096
+    BUFFER_SIZE = 1024 * 1024
+    # hashlib releases the GIL while hashing large buffers, so threads allow
+    # to overlap disk reads and hash computation for different files
+    HASHING_THREADS = min(32, (os.cpu_count() or 1) * 4)
     SUPPORTED_HASH_TYPES = [HashType.SHA256, HashType.DROPBOX_SHA256]
+    # files being written are created under this prefix first, leftovers of
+    # interrupted writes are not user files, so they are excluded from state
+    TEMP_FILE_PREFIX = ".sync-tmp-"
 
     def __init__(self, root_dir: str, cache: CacheBase = None):
         LOGGER.debug('init FS provider with root at "%s"', root_dir)
@@ -60,52 +71,134 @@ class FSProvider(ProviderBase, SafeUpdateSupportMixin):
     def is_case_sensitive(self) -> bool:
         return self.__is_case_sensitive
 
-    def _file_state(self, rel_path: str) -> FileState:
-        abs_path = self._abs_path(rel_path)
+    def _file_state(
+        self,
+        rel_path: str,
+        abs_path: str | None = None,
+        stat: os.stat_result | None = None,
+    ) -> FileState:
+        if abs_path is None:
+            abs_path = self._abs_path(rel_path)
+        if stat is None:
+            stat = os.stat(abs_path)
         return FileState(
             path=rel_path,
-            content_hash=self.compute_hash(rel_path, HashType.SHA256),
+            content_hash=self._compute_hash(rel_path, abs_path, stat, HashType.SHA256),
             hash_type=HashType.SHA256,
-            revision=str(os.path.getmtime(abs_path)),
+            revision=str(stat.st_mtime),
         )
 
-    def get_state(self, depth: int | None = None) -> StorageState:
-        files = {}
-
-        def walk(dir_path: str, level: int):
-            LOGGER.debug('walking "%s"...', dir_path)
+    @classmethod
+    def _scan_dir(cls, dir_path: str, root_prefix_len: int):
+        LOGGER.debug('walking "%s"...', dir_path)
 
-            if depth is not None and level > depth:
-                return
+        files, dir_paths = [], []
 
-            for entry in os.scandir(dir_path):
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
                 if entry.is_file():
-                    rel_path = os.path.relpath(entry.path, self.root_dir)
-                    rel_path = unixify_path(rel_path)
+                    if entry.name.startswith(cls.TEMP_FILE_PREFIX):
+                        LOGGER.debug('skipping temporary file "%s"', entry.path)
+                        continue
+                    rel_path = unixify_path(entry.path[root_prefix_len:])
                     rel_path = normalize_unicode(rel_path)
+                    # stat result is cached by the entry itself
+                    files.append((rel_path, entry.path, entry.stat()))
+                elif entry.is_dir():
+                    dir_paths.append(entry.path)
 
-                    if rel_path in files:
-                        raise ProviderError(
-                            f"There seem to be multiple files using same name, "
-                            f"but in different Unicode normalization forms. "
-                            f'This is not supported. File path was "{rel_path}"'
-                        )
+        return files, dir_paths
 
-                    files[rel_path] = self._file_state(rel_path)
-                elif entry.is_dir():
-                    walk(entry.path, level + 1)
+    def get_state(self, depth: int | None = None) -> StorageState:
+        # entries paths are built by joining the scanned directory path, so
+        # relative path is just a suffix after the root directory prefix
+        root_prefix_len = len(os.path.join(self.root_dir, ""))
 
         self._ensure_dir(self.root_dir)
-        walk(self.root_dir, level=1)
 
-        LOGGER.debug("discovered %d files", len(files))
+        file_state_futures = {}
+        # hard links share the content, so only one of them needs hashing
+        hard_link_futures = {}
+
+        # sibling directories are scanned concurrently which helps a lot for
+        # network file systems, while files are hashed as soon as discovered
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.HASHING_THREADS, thread_name_prefix="hasher"
+        ) as executor:
+
+            def scan(dir_path: str):
+                return executor.submit(self._scan_dir, dir_path, root_prefix_len)
+
+            # root directory itself is the first level, so zero depth means
+            # that nothing is listed at all
+            pending_scans = {}
+            if depth is None or depth >= 1:
+                pending_scans[scan(self.root_dir)] = 1
+
+            while pending_scans:
+                done, _ = concurrent.futures.wait(
+                    pending_scans, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+
+                for scan_future in done:
+                    level = pending_scans.pop(scan_future)
+                    files, dir_paths = scan_future.result()
+
+                    for rel_path, abs_path, stat in files:
+                        if rel_path in file_state_futures:
+                            raise ProviderError(
+                                f"There seem to be multiple files using same name, "
+                                f"but in different Unicode normalization forms. "
+                                f'This is not supported. File path was "{rel_path}"'
+                            )
+
+                        inode = (stat.st_dev, stat.st_ino)
+
+                        if stat.st_nlink > 1 and inode in hard_link_futures:
+                            file_state_futures[rel_path] = hard_link_futures[inode]
+                            continue
+
+                        future = executor.submit(
+                            self._file_state, rel_path, abs_path, stat
+                        )
+                        file_state_futures[rel_path] = future
+
+                        if stat.st_nlink > 1:
+                            hard_link_futures[inode] = future
+
+                    if depth is None or level < depth:
+                        for dir_path in dir_paths:
+                            pending_scans[scan(dir_path)] = level + 1
+
+            LOGGER.debug("discovered %d files", len(file_state_futures))
+
+            files = {}
+
+            for rel_path, future in file_state_futures.items():
+                file_state = future.result()
+
+                if file_state.path != rel_path:
+                    # hard link to the file which was actually hashed
+                    file_state = FileState(
+                        path=rel_path,
+                        content_hash=file_state.content_hash,
+                        hash_type=file_state.hash_type,
+                        revision=file_state.revision,
+                    )
+
+                files[rel_path] = file_state
+
         return StorageState(files)
 
     def _abs_path(self, path: str):
-        abs_path = os.path.join(self.root_dir, path)
-        abs_path = os.path.abspath(abs_path)
+        # root directory is already absolute, so normpath is enough to resolve
+        # relative segments and unlike abspath it does not query working dir
+        abs_path = os.path.normpath(os.path.join(self.root_dir, path))
         abs_path = normalize_unicode(abs_path)
-        if not abs_path.startswith(self.root_dir):
+        # check against the prefix ending with separator, otherwise sibling
+        # directory sharing the name prefix would be treated as inside root
+        root_prefix = os.path.join(self.root_dir, "")
+        if abs_path != self.root_dir and not abs_path.startswith(root_prefix):
             raise ProviderError("path outside of root dir")
         return abs_path
 
@@ -130,23 +223,106 @@ class FSProvider(ProviderBase, SafeUpdateSupportMixin):
             # is already exists
             os.makedirs(dir_path, exist_ok=True)
 
+    @staticmethod
+    def _copy_file_range(source: BinaryIO, destination: BinaryIO) -> bool:
+        """
+        Copies the rest of the source into the destination inside the kernel
+        when source is a regular file (e.g. it was opened by another FS
+        provider). Depending on the file system it can even be a reflink.
+
+        Returns False if copying this way is not possible, so that caller can
+        fall back to the regular copying.
+        """
+        if not hasattr(os, "copy_file_range"):
+            return False
+
+        try:
+            source_fd = source.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return False
+
+        source_stat = os.fstat(source_fd)
+        if not S_ISREG(source_stat.st_mode):
+            return False
+
+        # explicit source offset accounts for data already buffered by the
+        # file object and leaves its position intact in case of fallback
+        offset = start_offset = source.tell()
+        destination.flush()
+        destination_fd = destination.fileno()
+
+        while offset < source_stat.st_size:
+            try:
+                copied = os.copy_file_range(
+                    source_fd,
+                    destination_fd,
+                    source_stat.st_size - offset,
+                    offset_src=offset,
+                )
+            except OSError as err:
+                if offset == start_offset:
+                    LOGGER.debug("copy_file_range is not possible: %s", err)
+                    return False
+                raise
+            if not copied:
+                # some file systems (e.g. procfs) report zero right away, so
+                # regular copying still has a chance to work
+                if offset == start_offset:
+                    LOGGER.debug("copy_file_range copied nothing")
+                    return False
+                raise OSError(
+                    'copy_file_range stopped at %d of %d bytes: "%s"'
+                    % (offset, source_stat.st_size, source.name)
+                )
+            offset += copied
+
+        source.seek(offset)
+        return True
+
     def write(self, path: str, stream: BinaryIO):
         abs_path = self._abs_path(path)
         dir_path = os.path.dirname(abs_path)
 
         self._ensure_dir(dir_path)
 
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            while True:
-                buffer = stream.read(self.BUFFER_SIZE)
-                if not buffer:
-                    break
-                temp_file.write(buffer)
-            temp_file.flush()
-            os.fsync(temp_file.fileno())
+        # temporary file is created next to the target one to guarantee that
+        # it is on the same file system, so that replace is an atomic rename
+        # and partially written file is never observed under the target path
+        temp_file = tempfile.NamedTemporaryFile(
+            dir=dir_path, prefix=self.TEMP_FILE_PREFIX, suffix=".tmp", delete=False
+        )
+        content_hash = None
+        try:
+            with temp_file:
+                if not self._copy_file_range(stream, temp_file):
+                    content_hash = self._copy_and_hash(stream, temp_file)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+                stat = os.fstat(temp_file.fileno())
+
+            os.replace(temp_file.name, abs_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temp_file.name)
+            raise
+
+        # content was hashed while being copied, so remember the hash to avoid
+        # reading the file back when its state is requested after the write
+        if content_hash is not None:
+            self.cache.set(
+                self._hash_cache_key(path, HashType.SHA256),
+                self._hash_fingerprint(stat) + (content_hash,),
+            )
 
-        # now atomically move temp file
-        shutil.move(temp_file.name, abs_path)
+    def _copy_and_hash(self, source: BinaryIO, destination: BinaryIO) -> str:
+        sha = sha256()
+        while True:
+            buffer = source.read(self.BUFFER_SIZE)
+            if not buffer:
+                break
+            sha.update(buffer)
+            destination.write(buffer)
+        return sha.hexdigest()
 
     def update(self, path: str, content: BinaryIO, revision: str) -> None:
         # not bullet-proof, but still allows to limit concurrency issues
@@ -166,6 +342,7 @@ class FSProvider(ProviderBase, SafeUpdateSupportMixin):
             os.unlink(abs_path)
         except FileNotFoundError:
             raise FileNotFoundProviderError(f"File not found: {path}")
+        self._forget_cached_hashes(path)
 
     def remove_folder(self, path: str):
         abs_path = self._abs_path(path)
@@ -205,6 +382,7 @@ class FSProvider(ProviderBase, SafeUpdateSupportMixin):
             shutil.move(source_abs_path, destination_abs_path)
         except FileNotFoundError as err:
             raise FileNotFoundProviderError(f"File not found: {source_path}") from err
+        self._move_cached_hashes(source_path, destination_path)
 
     def supported_hash_types(self) -> List[HashType]:
         return self.SUPPORTED_HASH_TYPES
@@ -213,37 +391,88 @@ class FSProvider(ProviderBase, SafeUpdateSupportMixin):
         assert hash_type in self.SUPPORTED_HASH_TYPES
 
         abs_path = self._abs_path(path)
-        if not os.path.exists(abs_path):
+        try:
+            stat = os.stat(abs_path)
+        except FileNotFoundError:
             raise FileNotFoundProviderError(f"File not found: {path}")
 
-        modification_time = os.path.getmtime(abs_path)
+        return self._compute_hash(path, abs_path, stat, hash_type)
+
+    @staticmethod
+    def _hash_cache_key(path: str, hash_type: HashType) -> str:
+        # plain concatenation is the cheapest way to build it and hash type
+        # is a string enum, so key is the same as "%s__%s" would produce
+        return hash_type + "__" + path
 
-        cache_key = "%s__%s" % (hash_type, path)
+    @staticmethod
+    def _hash_fingerprint(stat: os.stat_result) -> tuple:
+        # file is considered unchanged as long as both modification time and
+        # size match the ones which were recorded along with the cached hash
+        return stat.st_mtime_ns, stat.st_size
+
+    def _compute_hash(
+        self,
+        path: str,
+        abs_path: str,
+        stat: os.stat_result,
+        hash_type: HashType,
+    ) -> str:
+        fingerprint = self._hash_fingerprint(stat)
+
+        cache_key = self._hash_cache_key(path, hash_type)
         cached_value = self.cache.get(cache_key)
 
-        if cached_value is CACHE_MISS or cached_value[0] != modification_time:
-            if cached_value is not CACHE_MISS:
-                LOGGER.debug(
-                    "found previous cache value for modification time %s",
-                    cached_value[0],
-                )
+        if cached_value is not CACHE_MISS and cached_value[:2] == fingerprint:
+            return cached_value[2]
 
-            LOGGER.debug('compute %s hash for "%s"', hash_type.value, path)
+        if cached_value is not CACHE_MISS:
+            LOGGER.debug(
+                "found outdated cache value for modification time %s",
+                cached_value[0],
+            )
 
-            with open(abs_path, "rb") as f:
-                if hash_type == HashType.SHA256:
-                    hash_value = sha256_stream(f)
-                elif hash_type == HashType.DROPBOX_SHA256:
-                    hash_value = dropbox_hash_stream(f)
-                else:
-                    raise NotImplementedError
+        LOGGER.debug('compute %s hash for "%s"', hash_type.value, path)
 
-            self.cache.set(cache_key, (modification_time, hash_value))
-        else:
-            _, hash_value = cached_value
+        with open(abs_path, "rb") as f:
+            self._advise(f, "POSIX_FADV_SEQUENTIAL")
+
+            if hash_type == HashType.SHA256:
+                hash_value = sha256_stream(f, self.BUFFER_SIZE)
+            elif hash_type == HashType.DROPBOX_SHA256:
+                hash_value = dropbox_hash_stream(f)
+            else:
+                raise NotImplementedError
+
+            # hashing reads through every file once, do not let these pages
+            # evict the ones which are actually in use
+            self._advise(f, "POSIX_FADV_DONTNEED")
+
+        self.cache.set(cache_key, fingerprint + (hash_value,))
 
         return hash_value
 
+    @staticmethod
+    def _advise(f: BinaryIO, advice: str) -> None:
+        # not available on all the platforms
+        if hasattr(os, advice):
+            os.posix_fadvise(f.fileno(), 0, 0, getattr(os, advice))
+
+    def _forget_cached_hashes(self, path: str) -> None:
+        for hash_type in self.SUPPORTED_HASH_TYPES:
+            self.cache.delete(self._hash_cache_key(path, hash_type))
+
+    def _move_cached_hashes(self, source_path: str, destination_path: str) -> None:
+        # movement preserves both content and modification time, so there is
+        # no need to compute the hash again for the new location
+        for hash_type in self.SUPPORTED_HASH_TYPES:
+            source_key = self._hash_cache_key(source_path, hash_type)
+            cached_value = self.cache.get(source_key)
+            if cached_value is not CACHE_MISS:
+                self.cache.set(
+                    self._hash_cache_key(destination_path, hash_type), cached_value
+                )
+            self.cache.delete(source_key)
+
     def clone(self) -> "ProviderBase":
         return FSProvider(self.root_dir, self.cache)
 
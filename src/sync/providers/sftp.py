@@ -1,18 +1,24 @@
-import io
+import concurrent.futures
+import functools
 import logging
 import os.path
+import queue
 import shlex
 from stat import S_ISDIR, S_ISREG
+import threading
 from typing import (
     BinaryIO,
+    Callable,
     List,
     Optional,
+    Set,
     Tuple,
 )
 import uuid
 
 import paramiko
 
+from sync.cache import CACHE_MISS, CacheBase, InMemoryCache
 from sync.hashing import HashType, hash_dict
 from sync.provider import (
     FileAlreadyExistsError,
@@ -31,6 +37,40 @@ from sync.state import FileState, StorageState
 
 LOGGER = logging.getLogger(__name__)
 
+# amount of files hashed by a single remote command; bounded, so that both
+# the list of paths and the output fit into SSH channel window
+HASH_BATCH_SIZE = 1000
+# large window lets many prefetched read requests be in flight at once, so
+# transfers are not bound by round-trip time on high latency links
+SFTP_WINDOW_SIZE = 64 * 1024 * 1024
+SFTP_MAX_PACKET_SIZE = 1024 * 1024
+# coreutils tool is preferred as shasum is a Perl script which is slower and
+# does not make use of hardware acceleration, the former is missing on MacOS
+SHA256_COMMAND = "$(command -v sha256sum || echo shasum -a 256)"
+# amount of SFTP sessions and threads used to list directories and hash files
+# concurrently, so that the round-trips overlap
+WORKERS = 8
+# keeps idle connection from being dropped by NAT and firewalls
+KEEPALIVE_INTERVAL = 30
+
+
+def _with_reconnect(method):
+    """
+    Retries the method once on a fresh connection when the persistent one
+    turns out to be broken. Only to be used for methods without side effects.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self: "STFPProvider", *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except (paramiko.SSHException, EOFError) as err:
+            LOGGER.warning("SSH connection failure (%s), reconnecting...", err)
+            self.close()
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class STFPProvider(ProviderBase):
     SUPPORTED_HASH_TYPES = [HashType.SHA256]
@@ -44,6 +84,7 @@ class STFPProvider(ProviderBase):
         key_path: Optional[str] = None,
         port: int = 22,
         is_case_sensitive: Optional[bool] = None,
+        cache: CacheBase = None,
     ):
         """
         Implements SFTP provider with POSIX-compatible (Unix, MacOS)
@@ -55,12 +96,19 @@ class STFPProvider(ProviderBase):
         self.password = password
         self.key_path = key_path
         self.port = port
+        self.cache = cache or InMemoryCache()
 
         if self.key_path:
             self.key_path = os.path.expanduser(self.key_path)
 
         self.__ssh_client = None
         self.__sftp_client = None
+        # clones use SSH connection of the original provider
+        self.__owns_ssh_client = True
+
+        # directories known to exist, shared with the clones
+        self._ensured_dirs: Set[str] = set()
+        self._ensured_dirs_lock = threading.Lock()
 
         if is_case_sensitive is not None:
             self.__is_case_sensitive = is_case_sensitive
@@ -134,14 +182,22 @@ class STFPProvider(ProviderBase):
         if self.__ssh_client is None:
             return True
 
-        if self.__ssh_client.get_transport() is None:
+        transport = self.__ssh_client.get_transport()
+        if (
+            transport is None
+            or not transport.is_active()
+            or not transport.is_authenticated()
+        ):
             return True
 
         return False
 
     def _connect(self) -> Tuple[paramiko.SSHClient, paramiko.SFTPClient]:
         if self._need_reconnect():
+            self.close()
+
             LOGGER.info("connecting to SSH server...")
+            self.__owns_ssh_client = True
             self.__ssh_client = paramiko.SSHClient()
             self.__ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
@@ -152,15 +208,17 @@ class STFPProvider(ProviderBase):
                 key_filename=self.key_path,
                 port=self.port,
             )
+            self.__ssh_client.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
 
-            self.__sftp_client = self.__ssh_client.open_sftp()
+        if self.__sftp_client is None:
+            self.__sftp_client = self._open_sftp(self.__ssh_client)
 
         return self.__ssh_client, self.__sftp_client
 
     @staticmethod
     def _sha256_file(ssh: paramiko.SSHClient, full_path: str):
         _, stdout, stderr = ssh.exec_command(
-            "shasum -a 256 %s" % shlex.quote(full_path)
+            "%s %s" % (SHA256_COMMAND, shlex.quote(full_path))
         )
         stdout_str = stdout.read().decode("utf-8")
         stderr_str = stderr.read().decode("utf-8")
@@ -171,56 +229,238 @@ class STFPProvider(ProviderBase):
             if stderr_str:
                 LOGGER.error("STDERR: %s", stderr_str)
             raise ProviderError("unable to calculate file hash")
-        return stdout_str.split(" ")[0]
+        # hex encoded SHA-256 is exactly 64 characters long, names containing
+        # new lines are escaped and such lines are prefixed with a backslash
+        return stdout_str.lstrip("\\")[:64]
 
-    def _file_state(self, ssh: paramiko.SSHClient, full_path: str):
-        rel_path = relative_path(full_path, self.root_dir)
-        rel_path = normalize_unicode(rel_path)
-        return FileState(
-            path=rel_path,
-            content_hash=STFPProvider._sha256_file(ssh, full_path),
-            hash_type=HashType.SHA256,
-        )
+    @staticmethod
+    def _sha256_files(ssh: paramiko.SSHClient, full_paths: List[str]) -> List[str]:
+        """
+        Hashes multiple files using a single remote command instead of
+        spending a round-trip per file. Paths are passed via stdin separated
+        by NUL, so that there is no need to escape them.
+        """
+        stdin, stdout, stderr = ssh.exec_command("xargs -0 %s --" % SHA256_COMMAND)
+        stdin.write(b"\0".join(path.encode("utf-8") for path in full_paths))
+        stdin.channel.shutdown_write()
 
-    def get_state(self, depth: int | None = None) -> StorageState:
-        ssh, sftp = self._connect()
-        files = {}
+        stdout_str = stdout.read().decode("utf-8")
+        stderr_str = stderr.read().decode("utf-8")
+        exit_code = stdout.channel.recv_exit_status()
 
-        def walk(dir_path, cur_depth):
-            if depth is not None and cur_depth > depth:
-                return
+        # output lines follow the order of the input, names containing new
+        # lines are escaped and such lines are prefixed with a backslash
+        lines = stdout_str.split("\n")[:-1]
+        hashes = [line.lstrip("\\")[:64] for line in lines]
+
+        if exit_code != 0 or len(hashes) != len(full_paths):
+            if stdout_str:
+                LOGGER.error("STDOUT: %s", stdout_str)
+            if stderr_str:
+                LOGGER.error("STDERR: %s", stderr_str)
+            raise ProviderError("unable to calculate file hashes")
 
-            sftp.chdir(dir_path)
-            dirs = []
+        return hashes
 
-            for entry in sftp.listdir_attr():
-                is_dir = S_ISDIR(entry.st_mode)
-                is_file = S_ISREG(entry.st_mode)
+    @staticmethod
+    def _hash_cache_key(path: str) -> str:
+        return HashType.SHA256 + "__" + path
+
+    @staticmethod
+    def _hash_fingerprint(attrs: paramiko.SFTPAttributes) -> tuple:
+        # file is considered unchanged as long as both modification time (which
+        # SFTP reports in whole seconds) and size match the cached ones
+        return attrs.st_mtime, attrs.st_size
+
+    def _cached_hash(self, path: str, attrs: paramiko.SFTPAttributes) -> str | None:
+        cached_value = self.cache.get(self._hash_cache_key(path))
+        if cached_value is CACHE_MISS:
+            return None
+        if cached_value[:2] != self._hash_fingerprint(attrs):
+            return None
+        return cached_value[2]
+
+    def _remember_hash(
+        self, path: str, attrs: paramiko.SFTPAttributes, content_hash: str
+    ) -> None:
+        self.cache.set(
+            self._hash_cache_key(path),
+            self._hash_fingerprint(attrs) + (content_hash,),
+        )
+
+    def _forget_hash(self, path: str) -> None:
+        self.cache.delete(self._hash_cache_key(normalize_unicode(path)))
+
+    def _move_cached_hash(self, source_path: str, destination_path: str) -> None:
+        # rename preserves both content and modification time, so the entry
+        # stays valid for the new location; otherwise an entry left there by
+        # an externally removed file must not be matched by the moved one
+        source_key = self._hash_cache_key(normalize_unicode(source_path))
+        destination_key = self._hash_cache_key(normalize_unicode(destination_path))
+        cached_value = self.cache.get(source_key)
+        if cached_value is not CACHE_MISS:
+            self.cache.set(destination_key, cached_value)
+        else:
+            self.cache.delete(destination_key)
+        self.cache.delete(source_key)
+
+    def _file_state(
+        self,
+        ssh: paramiko.SSHClient,
+        full_path: str,
+        attrs: paramiko.SFTPAttributes,
+    ) -> FileState:
+        rel_path = relative_path(full_path, self.root_dir)
+        rel_path = normalize_unicode(rel_path)
 
-                filename = entry.filename
-                full_path = path_join(dir_path, filename)
-                rel_path = relative_path(full_path, self.root_dir)
-                rel_path = normalize_unicode(rel_path)
+        content_hash = self._cached_hash(rel_path, attrs)
 
-                if is_file:
+        if content_hash is None:
+            content_hash = self._sha256_file(ssh, full_path)
+            self._remember_hash(rel_path, attrs, content_hash)
 
-                    if rel_path in files:
-                        raise ProviderError(
-                            f"There seem to be a file with same name, but in "
-                            f"different Unicode normalization forms. This is not "
-                            f'supported. File path is "{rel_path}"'
-                        )
+        return FileState(
+            path=rel_path,
+            content_hash=content_hash,
+            hash_type=HashType.SHA256,
+        )
 
-                    files[rel_path] = self._file_state(ssh, full_path)
+    def _open_sftp(self, ssh: paramiko.SSHClient) -> paramiko.SFTPClient:
+        return paramiko.SFTPClient.from_transport(
+            ssh.get_transport(),
+            window_size=SFTP_WINDOW_SIZE,
+            max_packet_size=SFTP_MAX_PACKET_SIZE,
+        )
 
-                if is_dir:
-                    dirs.append(filename)
+    @staticmethod
+    def _scan_dir(list_dir: Callable[[str], list], dir_path: str, rel_dir: str):
+        # relative directory path ("" for root, otherwise ending with separator)
+        # is passed along, so that there is no need to relativize every path
+        files, dirs = [], []
+
+        for entry in list_dir(dir_path):
+            full_path = path_join(dir_path, entry.filename)
+            rel_path = rel_dir + entry.filename
+
+            if S_ISREG(entry.st_mode):
+                files.append((normalize_unicode(rel_path), full_path, entry))
+            elif S_ISDIR(entry.st_mode):
+                dirs.append((full_path, rel_path + "/"))
+
+        return files, dirs
+
+    def _hash_batch(self, ssh: paramiko.SSHClient, batch: list) -> List[FileState]:
+        hashes = self._sha256_files(ssh, [full_path for _, full_path, _ in batch])
+        file_states = []
+
+        for (rel_path, _, attrs), content_hash in zip(batch, hashes):
+            self._remember_hash(rel_path, attrs, content_hash)
+            file_states.append(
+                FileState(
+                    path=rel_path,
+                    content_hash=content_hash,
+                    hash_type=HashType.SHA256,
+                )
+            )
 
-            for dir_name in dirs:
-                walk(path_join(dir_path, dir_name), cur_depth=cur_depth + 1)
+        return file_states
 
+    @_with_reconnect
+    def get_state(self, depth: int | None = None) -> StorageState:
+        ssh, sftp = self._connect()
         self._ensure_dir(ssh, self.root_dir)
-        walk(self.root_dir, cur_depth=1)
+
+        # SFTP session handles one request at a time, but there can be many
+        # sessions over the same SSH connection to list directories in parallel
+        sftp_clients = queue.Queue()
+        sftp_clients.put(sftp)
+        extra_sftp_clients = []
+
+        def list_dir(dir_path: str) -> list:
+            try:
+                sftp_client = sftp_clients.get_nowait()
+            except queue.Empty:
+                sftp_client = self._open_sftp(ssh)
+                extra_sftp_clients.append(sftp_client)
+            try:
+                # unlike listdir_attr it keeps multiple READDIR requests in
+                # flight instead of waiting for every reply in turn
+                return list(sftp_client.listdir_iter(dir_path))
+            finally:
+                sftp_clients.put(sftp_client)
+
+        discovered = set()
+        files = {}
+        hash_futures = []
+        pending_batch = []
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=WORKERS, thread_name_prefix="sftp"
+            ) as executor:
+
+                def scan(dir_path: str, rel_dir: str):
+                    return executor.submit(self._scan_dir, list_dir, dir_path, rel_dir)
+
+                def hash_pending_batch():
+                    hash_futures.append(
+                        executor.submit(self._hash_batch, ssh, list(pending_batch))
+                    )
+                    pending_batch.clear()
+
+                # root directory itself is the first level, so zero depth means
+                # that nothing is listed at all
+                pending_scans = {}
+                if depth is None or depth >= 1:
+                    pending_scans[scan(self.root_dir, "")] = 1
+
+                while pending_scans:
+                    done, _ = concurrent.futures.wait(
+                        pending_scans, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+
+                    for scan_future in done:
+                        level = pending_scans.pop(scan_future)
+                        scanned_files, dirs = scan_future.result()
+
+                        for rel_path, full_path, attrs in scanned_files:
+                            if rel_path in discovered:
+                                raise ProviderError(
+                                    f"There seem to be a file with same name, but "
+                                    f"in different Unicode normalization forms. "
+                                    f'This is not supported. File path is "{rel_path}"'
+                                )
+
+                            discovered.add(rel_path)
+                            content_hash = self._cached_hash(rel_path, attrs)
+
+                            if content_hash is not None:
+                                files[rel_path] = FileState(
+                                    path=rel_path,
+                                    content_hash=content_hash,
+                                    hash_type=HashType.SHA256,
+                                )
+                                continue
+
+                            pending_batch.append((rel_path, full_path, attrs))
+
+                            # hashing overlaps with listing of remaining dirs
+                            if len(pending_batch) == HASH_BATCH_SIZE:
+                                hash_pending_batch()
+
+                        if depth is None or level < depth:
+                            for dir_path, rel_dir in dirs:
+                                pending_scans[scan(dir_path, rel_dir)] = level + 1
+
+                if pending_batch:
+                    hash_pending_batch()
+
+                for future in hash_futures:
+                    for file_state in future.result():
+                        files[file_state.path] = file_state
+        finally:
+            for sftp_client in extra_sftp_clients:
+                sftp_client.close()
 
         return StorageState(files)
 
@@ -231,32 +471,38 @@ class STFPProvider(ProviderBase):
             raise ProviderError("Path outside of the root dir!")
         return full_path
 
+    @_with_reconnect
     def get_file_state(self, path: str) -> FileState:
         ssh, sftp = self._connect()
         full_path = self._full_path(path)
 
-        dir_path, filename = path_split(full_path)
         try:
-            sftp.chdir(dir_path)
-            entry = sftp.lstat(filename)
+            entry = sftp.lstat(full_path)
             assert S_ISREG(entry.st_mode)
-            return self._file_state(ssh, full_path)
+            return self._file_state(ssh, full_path, entry)
         except FileNotFoundError:
             raise FileNotFoundProviderError(f"File not found: {full_path}")
 
+    @_with_reconnect
     def read(self, path: str) -> BinaryIO:
         ssh, sftp = self._connect()
         full_path = self._full_path(path)
 
-        buffer = io.BytesIO()
         try:
-            sftp.getfo(full_path, buffer)
-            buffer.seek(0)
-            return buffer
+            stream = sftp.open(full_path, "rb")
+            # pipeline read requests in background, so that consumer does not
+            # wait for a round-trip on every chunk; note that the whole file is
+            # requested up front, so unread data is buffered in memory
+            stream.prefetch()
+            return stream
         except FileNotFoundError:
             raise FileNotFoundProviderError(f"File not found: {full_path}")
 
     def _ensure_dir(self, ssh: paramiko.SSHClient, dir_path: str) -> None:
+        with self._ensured_dirs_lock:
+            if dir_path in self._ensured_dirs:
+                return
+
         stdin, stdout, stderr = ssh.exec_command("mkdir -p %s" % shlex.quote(dir_path))
 
         exit_code = stdout.channel.recv_exit_status()
@@ -270,12 +516,30 @@ class STFPProvider(ProviderBase):
                 LOGGER.error("STDERR: %s", stderr_data)
             raise ProviderError("unable to ensure directory exists")
 
+        with self._ensured_dirs_lock:
+            self._ensured_dirs.add(dir_path)
+
+    def _forget_dirs(self, dir_path: str) -> None:
+        prefix = dir_path.rstrip("/") + "/"
+        with self._ensured_dirs_lock:
+            self._ensured_dirs.difference_update(
+                [x for x in self._ensured_dirs if x == dir_path or x.startswith(prefix)]
+            )
+
     def write(self, path: str, content: BinaryIO) -> None:
         ssh, sftp = self._connect()
         full_path = self._full_path(path)
         dir_path, _ = path_split(full_path)
         self._ensure_dir(ssh, dir_path)
-        sftp.putfo(content, full_path)
+        try:
+            sftp.putfo(content, full_path)
+        except FileNotFoundError:
+            # directory was removed behind our back, the file is not opened
+            # yet, so it is safe to ensure directory once again and retry
+            self._forget_dirs(dir_path)
+            self._ensure_dir(ssh, dir_path)
+            sftp.putfo(content, full_path)
+        self._forget_hash(path)
 
     def remove_file(self, path: str) -> None:
         ssh, sftp = self._connect()
@@ -284,36 +548,24 @@ class STFPProvider(ProviderBase):
             sftp.remove(full_path)
         except FileNotFoundError:
             raise FileNotFoundProviderError(f"File not found: {full_path}")
+        self._forget_hash(path)
 
     def remove_folder(self, path: str) -> None:
-        ssh, sftp = self._connect()
         dir_path = self._full_path(path)
+        quoted_dir_path = shlex.quote(dir_path)
 
+        # removing the whole tree remotely takes a single round-trip instead
+        # of a request per every file and directory inside
         try:
+            stdout, _ = self.__run_ssh_command(
+                "if [ -d %s ]; then rm -rf -- %s; else echo not-found; fi"
+                % (quoted_dir_path, quoted_dir_path)
+            )
+        finally:
+            self._forget_dirs(dir_path)
 
-            def recursive_remove(dir_path: str):
-                for entry in sftp.listdir_attr(dir_path):
-                    is_dir = S_ISDIR(entry.st_mode)
-                    is_file = S_ISREG(entry.st_mode)
-
-                    full_path = path_join(dir_path, entry.filename)
-
-                    if is_file:
-                        sftp.remove(full_path)
-                    elif is_dir:
-                        # remove contents
-                        recursive_remove(full_path)
-
-                        # remove dir itself
-                        sftp.rmdir(full_path)
-
-            # remove contents of the folder recursively
-            recursive_remove(dir_path)
-
-            # remove empty folder
-            sftp.rmdir(dir_path)
-        except FileNotFoundError as err:
-            raise FolderNotFoundProviderError(f"Folder not found: {dir_path}") from err
+        if stdout.strip() == "not-found":
+            raise FolderNotFoundProviderError(f"Folder not found: {dir_path}")
 
     def move(self, source_path: str, destination_path: str) -> None:
         ssh, sftp = self._connect()
@@ -362,9 +614,12 @@ class STFPProvider(ProviderBase):
         except FileNotFoundError:
             raise FileNotFoundProviderError(f"File not found: {source_full_path}")
 
+        self._move_cached_hash(source_path, destination_path)
+
     def supported_hash_types(self) -> List[HashType]:
         return self.SUPPORTED_HASH_TYPES
 
+    @_with_reconnect
     def compute_hash(self, path: str, hash_type: HashType) -> str:
         if hash_type == HashType.SHA256:
             ssh, sftp = self._connect()
@@ -373,7 +628,7 @@ class STFPProvider(ProviderBase):
         raise Exception("not supported")
 
     def clone(self) -> "ProviderBase":
-        return STFPProvider(
+        cloned = STFPProvider(
             host=self.host,
             username=self.username,
             root_dir=self.root_dir,
@@ -381,17 +636,26 @@ class STFPProvider(ProviderBase):
             key_path=self.key_path,
             port=self.port,
             is_case_sensitive=self.__is_case_sensitive,
+            cache=self.cache,
         )
+        # opening another session over the existing connection is way cheaper
+        # than a new connection with its handshake and authentication
+        cloned.__ssh_client, _ = self._connect()
+        cloned.__owns_ssh_client = False
+        cloned._ensured_dirs = self._ensured_dirs
+        cloned._ensured_dirs_lock = self._ensured_dirs_lock
+        return cloned
 
     def close(self):
-        if self.__ssh_client:
-            self.__ssh_client.close()
-            self.__ssh_client = None
-
         if self.__sftp_client:
             self.__sftp_client.close()
             self.__sftp_client = None
 
+        if self.__ssh_client:
+            if self.__owns_ssh_client:
+                self.__ssh_client.close()
+            self.__ssh_client = None
+
     def __del__(self):
         try:
             self.close()
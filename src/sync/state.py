@@ -1,10 +1,14 @@
 import pickle
+import sys
 from typing import BinaryIO, Dict
 
 from sync.hashing import HashType
 
 
 class FileState:
+    # there is an instance per every file, so avoid per-instance dict
+    __slots__ = ("path", "content_hash", "hash_type", "revision")
+
     def __init__(
         self,
         path: str,
@@ -35,6 +39,14 @@ class FileState:
             and self.revision == other.revision
         )
 
+    def __setstate__(self, state):
+        # states saved before slots were introduced carry plain attributes
+        # dictionary, while slotted instances are pickled as (None, slots)
+        if isinstance(state, tuple):
+            _, state = state
+        for name, value in state.items():
+            setattr(self, name, value)
+
 
 class StorageState:
     def __init__(self, files: Dict[str, FileState] = None):
@@ -52,6 +64,20 @@ class StorageState:
             return False
         return self.files == other.files
 
+    def intern_strings(self) -> None:
+        """
+        Makes equal paths and hashes share the same string object, which
+        considerably reduces memory footprint of a loaded state, as the same
+        strings repeat as keys, paths and between source and destination.
+        """
+        files = {}
+        for key, file_state in self.files.items():
+            file_state.path = sys.intern(file_state.path)
+            if isinstance(file_state.content_hash, str):
+                file_state.content_hash = sys.intern(file_state.content_hash)
+            files[sys.intern(key)] = file_state
+        self.files = files
+
 
 class SyncPairState:
     def __init__(self, source_state: StorageState, dest_state: StorageState):
@@ -65,4 +91,6 @@ class SyncPairState:
     def load(f: BinaryIO) -> "SyncPairState":
         obj = pickle.load(f)
         assert isinstance(obj, SyncPairState)
+        obj.source_state.intern_strings()
+        obj.dest_state.intern_strings()
         return obj
@@ -1,9 +1,14 @@
 import io
 import logging
 import os
+import tempfile
 from typing import BinaryIO
+import uuid
 
-from sync.provider import FolderNotFoundProviderError
+import pytest
+
+from sync.cache import InMemoryCache
+from sync.provider import FolderNotFoundProviderError, ProviderBase
 from sync.providers.common import path_split
 from sync.providers.dropbox import DropboxProvider
 from sync.providers.fs import FSProvider
@@ -11,11 +16,35 @@ from sync.providers.sftp import STFPProvider
 
 LOGGER = logging.getLogger(__name__)
 
+DROPBOX_ENV_VARS = ("DROPBOX_TOKEN", "DROPBOX_APP_KEY", "DROPBOX_APP_SECRET")
+
+# skips the whole class at once instead of failing setup of every test
+requires_dropbox = pytest.mark.skipif(
+    not all(name in os.environ for name in DROPBOX_ENV_VARS),
+    reason="Dropbox credentials are not set",
+)
+
+# RAM backed file system spares tests from disk writes and fsync latency
+SHARED_MEMORY_DIR = "/dev/shm"
+
 
 def bytes_as_stream(data: bytes) -> BinaryIO:
     return io.BytesIO(data)
 
 
+def make_temp_dir() -> str:
+    if os.path.isdir(SHARED_MEMORY_DIR) and os.access(SHARED_MEMORY_DIR, os.W_OK):
+        return tempfile.mkdtemp(dir=SHARED_MEMORY_DIR)
+    return tempfile.mkdtemp()
+
+
+def make_remote_root(base_dir: str) -> str:
+    # uuid keeps concurrent tests apart, while worker name (when running under
+    # pytest-xdist) tells which of the parallel workers left a directory behind
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+    return "%s/%s/%s" % (base_dir, worker, uuid.uuid4())
+
+
 def random_bytes_stream(count: int = 1024) -> BinaryIO:
     data = os.urandom(count)
     return bytes_as_stream(data)
@@ -25,6 +54,21 @@ def stream_to_bytes(stream: BinaryIO) -> bytes:
     return stream.read()
 
 
+def read_bytes(provider: ProviderBase, path: str) -> bytes:
+    # streams may hold remote handles (e.g. SFTP), so release them right away
+    with provider.read(path) as stream:
+        return stream_to_bytes(stream)
+
+
+def clone_provider(provider: ProviderBase, root_dir: str) -> ProviderBase:
+    # clones reuse connection of the original, but the cache has to be separate
+    # as it is shared by clones as well and entries are keyed by relative paths
+    cloned = provider.clone()
+    cloned.root_dir = root_dir
+    cloned.cache = InMemoryCache()
+    return cloned
+
+
 def cleanup_provider(provider: DropboxProvider | FSProvider | STFPProvider) -> None:
     cleanup_instance = provider.clone()
     parent_dir, subdir = path_split(cleanup_instance.root_dir)
@@ -6,19 +6,27 @@ import uuid
 
 import pytest
 
+from sync.cache import InMemoryCache
 from sync.core import ProviderBase
 from sync.providers.dropbox import DropboxProvider
-from tests.common import cleanup_provider
+from tests.common import (
+    bytes_as_stream,
+    cleanup_provider,
+    make_remote_root,
+    requires_dropbox,
+)
 from tests.providers.test_provider_base import ProviderTestBase
 
 LOGGER = logging.getLogger(__name__)
 
 
 @pytest.mark.dropbox
+@requires_dropbox
 class DropboxProviderTest(ProviderTestBase):
     __test__ = True
 
-    def __create_provider(self, root_dir: str) -> DropboxProvider:
+    @staticmethod
+    def __create_provider(root_dir: str) -> DropboxProvider:
         return DropboxProvider(
             root_dir=root_dir,
             account_id="test",
@@ -28,15 +36,65 @@ class DropboxProviderTest(ProviderTestBase):
             is_refresh_token=True,
         )
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # tests use subfolders of a shared root, so that all of them are
+        # cleaned up by a single request instead of one per test
+        cls.class_root_dir = make_remote_root("/temp/sync-tests")
+        # access token is obtained once and then shared by all the clones
+        cls.base_provider = cls.__create_provider(cls.class_root_dir)
+        cls.base_provider._get_dropbox().check_and_refresh_access_token()
+
+    @classmethod
+    def tearDownClass(cls):
+        cleanup_provider(cls.base_provider)
+        super().tearDownClass()
+
     def setUp(self):
         super().setUp()
-        self.root_dir = "/temp/sync-tests/%s" % str(uuid.uuid4())
-        self.provider = self.__create_provider(self.root_dir)
-        self.addCleanup(lambda: cleanup_provider(self.provider))
+        self.root_dir = "%s/%s" % (self.class_root_dir, str(uuid.uuid4()))
+        self.provider = self.base_provider.clone()
+        self.provider.root_dir = self.root_dir
+        # listing is cached regardless of the root, do not let tests see each other
+        self.provider.cache = InMemoryCache()
 
     def get_provider(self) -> ProviderBase:
         return self.provider
 
+    def test_remove_many(self):
+        for path in ["foo", "bar", "nested/baz"]:
+            with bytes_as_stream(path.encode()) as stream:
+                self.provider.write(path, stream)
+
+        self.provider.remove_many(["foo", "nested"])
+
+        state = self.provider.get_state()
+        self.assertEqual({"bar"}, set(state.files))
+
+    def test_state_is_updated_incrementally(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        with bytes_as_stream(b"bar") as stream:
+            self.provider.write("nested/bar", stream)
+
+        self.provider.get_state()
+
+        with bytes_as_stream(b"baz") as stream:
+            self.provider.write("baz", stream)
+
+        with bytes_as_stream(b"foo2") as stream:
+            self.provider.write("foo", stream)
+
+        self.provider.remove_folder("nested")
+
+        state = self.provider.get_state()
+        fresh_state = self.__create_provider(self.provider.root_dir).get_state()
+
+        self.assertEqual({"foo", "baz"}, set(state.files))
+        self.assertEqual(fresh_state.files, state.files)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,14 +1,21 @@
+import hashlib
+import io
 import logging
 import os
-import tempfile
 import unittest
 import unittest.mock as mock
 
 from sync.cache import InMemoryCache
 from sync.core import ProviderBase
+from sync.provider import ProviderError
 from sync.providers.dropbox import DropboxProvider
 from sync.providers.fs import FSProvider
-from tests.common import bytes_as_stream, cleanup_provider
+from tests.common import (
+    bytes_as_stream,
+    cleanup_provider,
+    make_temp_dir,
+    stream_to_bytes,
+)
 from tests.providers.test_provider_base import ProviderTestBase
 
 LOGGER = logging.getLogger(__name__)
@@ -25,7 +32,7 @@ class FSProviderTest(ProviderTestBase):
 
     def setUp(self):
         super().setUp()
-        self.root_dir = tempfile.mkdtemp()
+        self.root_dir = make_temp_dir()
         self.cache = InMemoryCache()
         self.provider = self.__create_provider(self.root_dir)
         self.addCleanup(lambda: cleanup_provider(self.provider))
@@ -34,15 +41,11 @@ class FSProviderTest(ProviderTestBase):
         return self.provider
 
     @staticmethod
-    def ensure_modification_time_changed(path, previous_mtime):
-        while True:
-            os.utime(path)
-            current_time = os.path.getmtime(path)
-            if current_time != previous_mtime:
-                break
-            LOGGER.debug(
-                "repeat changing modification time as it did" "not seem to change..."
-            )
+    def ensure_modification_time_changed(path):
+        # a whole second ahead is distinguishable even on file systems
+        # with coarse timestamps resolution
+        mtime_ns = os.stat(path).st_mtime_ns + 1_000_000_000
+        os.utime(path, ns=(mtime_ns, mtime_ns))
 
     def test_file_hash_is_taken_from_cache_until_file_modified(self):
         with mock.patch("sync.providers.fs.sha256_stream") as patcher:
@@ -51,10 +54,10 @@ class FSProviderTest(ProviderTestBase):
             with bytes_as_stream(b"foo") as stream:
                 self.provider.write("foo", stream)
 
-            foo_path = os.path.join(self.root_dir, "foo")
+            # forget hashes computed while writing
+            self.cache.clear()
 
-            mtime = os.path.getmtime(foo_path)
-            LOGGER.info("mtime: %s", mtime)
+            foo_path = os.path.join(self.root_dir, "foo")
 
             _ = self.provider.get_state()
             self.assertEqual(1, patcher.call_count)
@@ -71,7 +74,7 @@ class FSProviderTest(ProviderTestBase):
             patcher.reset_mock()
 
             # change modification date
-            self.ensure_modification_time_changed(foo_path, mtime)
+            self.ensure_modification_time_changed(foo_path)
 
             # cache miss
             _ = self.provider.get_state()
@@ -95,6 +98,9 @@ class FSProviderTest(ProviderTestBase):
             with bytes_as_stream(b"bar") as stream:
                 self.provider.write("bar", stream)
 
+            # forget hashes computed while writing
+            self.cache.clear()
+
             # cache miss
             _ = self.provider.get_state()
             self.assertEqual(2, patcher.call_count)
@@ -109,8 +115,7 @@ class FSProviderTest(ProviderTestBase):
             bar_path = os.path.join(self.root_dir, "bar")
 
             # modify one
-            foo_mtime = os.path.getmtime(foo_path)
-            self.ensure_modification_time_changed(foo_path, foo_mtime)
+            self.ensure_modification_time_changed(foo_path)
 
             # cache miss for one
             _ = self.provider.get_state()
@@ -118,10 +123,8 @@ class FSProviderTest(ProviderTestBase):
             patcher.reset_mock()
 
             # modify both
-            foo_mtime = os.path.getmtime(foo_path)
-            bar_mtime = os.path.getmtime(foo_path)
-            self.ensure_modification_time_changed(foo_path, foo_mtime)
-            self.ensure_modification_time_changed(bar_path, bar_mtime)
+            self.ensure_modification_time_changed(foo_path)
+            self.ensure_modification_time_changed(bar_path)
 
             # cache miss for both
             _ = self.provider.get_state()
@@ -136,6 +139,134 @@ class FSProviderTest(ProviderTestBase):
             self.assertEqual(2, patcher.call_count)
             patcher.reset_mock()
 
+    def test_write_from_regular_file(self):
+        source_path = os.path.join(self.root_dir, "source")
+        data = os.urandom(3 * 1024 * 1024 + 42)
+        with open(source_path, "wb") as f:
+            f.write(data)
+
+        with open(source_path, "rb") as stream:
+            self.provider.write("whole", stream)
+
+        # partially consumed stream is copied from its current position
+        with open(source_path, "rb") as stream:
+            stream.read(1024)
+            self.provider.write("tail", stream)
+
+        with self.provider.read("whole") as stream:
+            self.assertEqual(data, stream_to_bytes(stream))
+
+        with self.provider.read("tail") as stream:
+            self.assertEqual(data[1024:], stream_to_bytes(stream))
+
+    def test_failed_write_keeps_previous_content(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        class FailingStream(io.BytesIO):
+            def read(self, size=-1):
+                data = super().read(size)
+                if not data:
+                    raise OSError("read failed")
+                return data
+
+        with FailingStream(b"partial") as stream:
+            self.assertRaises(OSError, lambda: self.provider.write("foo", stream))
+
+        with self.provider.read("foo") as stream:
+            self.assertEqual(b"foo", stream_to_bytes(stream))
+
+        # no temporary files left behind
+        self.assertEqual(["foo"], os.listdir(self.root_dir))
+
+    def test_leftover_temporary_files_are_not_part_of_state(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        # as if write was interrupted before temporary file was renamed
+        temp_path = os.path.join(self.root_dir, FSProvider.TEMP_FILE_PREFIX + "x.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(b"partial")
+
+        self.assertEqual({"foo"}, set(self.provider.get_state().files))
+
+    def test_path_outside_of_root_dir(self):
+        sibling_dir = self.root_dir + "-sibling"
+        os.makedirs(sibling_dir)
+        self.addCleanup(lambda: os.rmdir(sibling_dir))
+
+        sibling_path = "../%s/foo" % os.path.basename(sibling_dir)
+
+        with bytes_as_stream(b"foo") as stream:
+            self.assertRaises(
+                ProviderError, lambda: self.provider.write(sibling_path, stream)
+            )
+
+        self.assertRaises(ProviderError, lambda: self.provider.read("../foo"))
+
+    def test_file_hash_is_taken_from_cache_after_move(self):
+        with mock.patch("sync.providers.fs.sha256_stream") as patcher:
+            patcher.return_value = "test_hash"
+
+            with bytes_as_stream(b"foo") as stream:
+                self.provider.write("foo", stream)
+
+            # forget hashes computed while writing
+            self.cache.clear()
+
+            _ = self.provider.get_state()
+            self.assertEqual(1, patcher.call_count)
+            patcher.reset_mock()
+
+            self.provider.move("foo", "bar/foo")
+
+            # content and modification time are preserved on move
+            state = self.provider.get_state()
+            self.assertEqual({"bar/foo"}, set(state.files))
+            self.assertEqual(0, patcher.call_count)
+
+    def test_file_hash_is_computed_on_write(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        with mock.patch("sync.providers.fs.sha256_stream") as patcher:
+            file_state = self.provider.get_file_state("foo")
+            self.assertEqual(0, patcher.call_count)
+
+        self.assertEqual(hashlib.sha256(b"foo").hexdigest(), file_state.content_hash)
+
+    def test_hard_links_are_hashed_once(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        os.link(os.path.join(self.root_dir, "foo"), os.path.join(self.root_dir, "bar"))
+
+        self.cache.clear()
+
+        with mock.patch("sync.providers.fs.sha256_stream") as patcher:
+            patcher.return_value = "test_hash"
+
+            state = self.provider.get_state()
+            self.assertEqual(1, patcher.call_count)
+
+        self.assertEqual({"foo", "bar"}, set(state.files))
+        self.assertEqual("foo", state.files["foo"].path)
+        self.assertEqual("bar", state.files["bar"].path)
+        self.assertEqual("test_hash", state.files["bar"].content_hash)
+        self.assertEqual("test_hash", state.files["foo"].content_hash)
+
+    @unittest.skipUnless(hasattr(os, "copy_file_range"), "copy_file_range required")
+    def test_write_falls_back_when_copy_file_range_copies_nothing(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        with mock.patch("os.copy_file_range", return_value=0):
+            with open(os.path.join(self.root_dir, "foo"), "rb") as f:
+                self.provider.write("bar", f)
+
+        with self.provider.read("bar") as f:
+            self.assertEqual(b"foo", f.read())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,22 +1,51 @@
+import hashlib
 import io
+import os
+import shutil
+import tempfile
 from unittest import TestCase, main
 
 import requests
 
-from sync.hashing import dropbox_hash_stream
+from sync.hashing import dropbox_hash_stream, sha256_stream
+
+SAMPLE_FILE_URL = "https://www.dropbox.com/static/images/developers/milky-way-nasa.jpg"
+SAMPLE_FILE_HASH = "485291fa0ee50c016982abbfa943957bcd231aae0492ccbaa22c58e3997b35e0"
+
+
+def _cached_download(url: str, expected_dropbox_hash: str) -> bytes:
+    cache_dir = os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "sync-tests",
+    )
+    cache_path = os.path.join(
+        cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".bin"
+    )
+
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            if dropbox_hash_stream(f) == expected_dropbox_hash:
+                f.seek(0)
+                return f.read()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        # let urllib3 undo transfer compression, if any
+        response.raw.decode_content = True
+        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+            shutil.copyfileobj(response.raw, f, 1024 * 1024)
+    os.replace(f.name, cache_path)
+
+    with open(cache_path, "rb") as f:
+        return f.read()
 
 
 class DropboxHashTest(TestCase):
     def test_sample_file(self):
-        response = requests.get(
-            "https://www.dropbox.com/static/images/developers/milky-way-nasa.jpg"
-        )
-        data_bytes = response.content
+        data_bytes = _cached_download(SAMPLE_FILE_URL, SAMPLE_FILE_HASH)
         with io.BytesIO(data_bytes) as data_stream:
-            self.assertEqual(
-                "485291fa0ee50c016982abbfa943957bcd231aae0492ccbaa22c58e3997b35e0",
-                dropbox_hash_stream(data_stream),
-            )
+            self.assertEqual(SAMPLE_FILE_HASH, dropbox_hash_stream(data_stream))
 
     def test_empty(self):
         with io.BytesIO() as data_stream:
@@ -25,6 +54,23 @@ class DropboxHashTest(TestCase):
                 dropbox_hash_stream(data_stream),
             )
 
+    def test_file_matches_in_memory_stream(self):
+        data_bytes = os.urandom(9 * 1024 * 1024 + 123)
+
+        with tempfile.TemporaryFile() as f:
+            f.write(data_bytes)
+            f.seek(0)
+
+            with io.BytesIO(data_bytes) as data_stream:
+                self.assertEqual(
+                    dropbox_hash_stream(data_stream), dropbox_hash_stream(f)
+                )
+
+            f.seek(0)
+
+            with io.BytesIO(data_bytes) as data_stream:
+                self.assertEqual(sha256_stream(data_stream), sha256_stream(f))
+
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,10 @@
 import abc
+import concurrent.futures
 import logging
+import os
+import threading
 import time
+from typing import Callable, List
 import unicodedata
 import unittest
 import uuid
@@ -17,10 +21,18 @@ from sync.provider import (
     SafeUpdateSupportMixin,
 )
 from sync.state import StorageState
-from tests.common import bytes_as_stream, random_bytes_stream, stream_to_bytes
+from tests.common import (
+    bytes_as_stream,
+    random_bytes_stream,
+    read_bytes,
+    stream_to_bytes,
+)
 
 LOGGER = logging.getLogger(__name__)
 
+# number of workers used to prepare files for tests concurrently
+PARALLELISM = int(os.environ.get("SYNC_TEST_PARALLELISM", "8"))
+
 
 class ProviderTestBase(unittest.TestCase):
     __test__ = False
@@ -33,16 +45,61 @@ class ProviderTestBase(unittest.TestCase):
         with random_bytes_stream(1024) as stream:
             provider.write(path, stream)
 
+    def create_files(self, provider: ProviderBase, paths: List[str], size: int = 1024):
+        # the same payload is fine for every file, as tests only care about
+        # the files being there, generating it once spares random bytes
+        with random_bytes_stream(size) as stream:
+            data = stream_to_bytes(stream)
+
+        def write(clone: ProviderBase, path: str):
+            with bytes_as_stream(data) as stream:
+                clone.write(path, stream)
+
+        self.run_concurrently(provider, write, paths)
+
+    def remove_files(self, provider: ProviderBase, paths: List[str]):
+        # default implementation removes files one by one
+        if type(provider).remove_many is not ProviderBase.remove_many:
+            provider.remove_many(paths)
+            return
+
+        self.run_concurrently(
+            provider, lambda clone, path: clone.remove_file(path), paths
+        )
+
+    @staticmethod
+    def run_concurrently(
+        provider: ProviderBase,
+        action: Callable[[ProviderBase, str], None],
+        paths: List[str],
+    ):
+        # remote providers spend most of the time waiting for round-trips,
+        # so overlap calls using a provider instance per worker like syncer does
+        clones = []
+        thread_local = threading.local()
+
+        def run(path: str):
+            clone = getattr(thread_local, "provider", None)
+            if clone is None:
+                clone = thread_local.provider = provider.clone()
+                clones.append(clone)
+            action(clone, path)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=PARALLELISM
+            ) as executor:
+                list(executor.map(run, paths))
+        finally:
+            for clone in clones:
+                clone.close()
+
     def assert_storage_state_equal(self, expected: StorageState, actual: StorageState):
-        self.assertEqual(len(expected.files), len(actual.files))
-        self.assertEqual(set(expected.files), set(actual.files))
-
-        for path in expected.files:
-            expected_file_state = expected.files[path]
-            actual_file_state = actual.files[path]
-            self.assertEqual(
-                expected_file_state.content_hash, actual_file_state.content_hash
-            )
+        # single comparison also gives a readable diff on mismatch
+        self.assertEqual(
+            {path: state.content_hash for path, state in expected.files.items()},
+            {path: state.content_hash for path, state in actual.files.items()},
+        )
 
     def test_write_read(self):
         provider = self.get_provider()
@@ -51,8 +108,7 @@ class ProviderTestBase(unittest.TestCase):
             with provider.read("foo") as read_stream:
                 self.assertEqual(b"test", stream_to_bytes(read_stream))
         state = provider.get_state()
-        self.assertEqual(1, len(state.files))
-        self.assertIn("foo", state.files)
+        self.assertEqual({"foo"}, set(state.files))
 
     def test_rewrite(self):
         provider = self.get_provider()
@@ -66,8 +122,7 @@ class ProviderTestBase(unittest.TestCase):
         with provider.read("foo") as read_stream:
             self.assertEqual(b"test2", stream_to_bytes(read_stream))
         state = provider.get_state()
-        self.assertEqual(1, len(state.files))
-        self.assertIn("foo", state.files)
+        self.assertEqual({"foo"}, set(state.files))
 
     def test_write_nested(self):
         provider = self.get_provider()
@@ -78,17 +133,13 @@ class ProviderTestBase(unittest.TestCase):
                 provider.write("foo/bar/baz.file", stream1)
                 provider.write("foo/bar.file", stream2)
         state = provider.get_state()
-        self.assertEqual(2, len(state.files))
-        self.assertIn("foo/bar.file", state.files)
-        self.assertIn("foo/bar/baz.file", state.files)
+        self.assertEqual({"foo/bar.file", "foo/bar/baz.file"}, set(state.files))
 
     @pytest.mark.slow
     def test_many_sub_directories(self):
         provider = self.get_provider()
         n = 16
-        for dir_idx in range(n):
-            with random_bytes_stream(128) as stream:
-                provider.write("dir_%s/data" % dir_idx, stream)
+        self.create_files(provider, ["dir_%s/data" % idx for idx in range(n)], 128)
         state = provider.get_state()
         self.assertEqual(n, len(state.files))
 
@@ -180,8 +231,7 @@ class ProviderTestBase(unittest.TestCase):
 
         state = provider.get_state()
 
-        self.assertEqual(1, len(state.files))
-        self.assertIn("bar", state.files)
+        self.assertEqual({"bar"}, set(state.files))
 
     def test_move_non_existing(self):
         provider = self.get_provider()
@@ -207,6 +257,45 @@ class ProviderTestBase(unittest.TestCase):
 
         self.assert_storage_state_equal(state_before, state_after)
 
+    def test_write_many(self):
+        provider = self.get_provider()
+
+        with bytes_as_stream(b"foo") as foo_stream:
+            with bytes_as_stream(b"bar") as bar_stream:
+                provider.write_many(
+                    [
+                        ("foo", foo_stream),
+                        ("nested/bar", bar_stream),
+                    ]
+                )
+
+        state = provider.get_state()
+        self.assertEqual({"foo", "nested/bar"}, set(state.files))
+        self.assertEqual(b"bar", read_bytes(provider, "nested/bar"))
+
+    def test_move_many(self):
+        provider = self.get_provider()
+
+        for path in ["foo", "bar"]:
+            with bytes_as_stream(path.encode()) as stream:
+                provider.write(path, stream)
+
+        provider.move_many([("foo", "nested/foo"), ("bar", "BAR")])
+
+        state = provider.get_state()
+        self.assertEqual({"nested/foo", "BAR"}, set(state.files))
+        self.assertEqual(b"foo", read_bytes(provider, "nested/foo"))
+
+    def test_remove_many(self):
+        provider = self.get_provider()
+
+        self.create_files(provider, ["foo", "bar", "nested/baz"])
+
+        provider.remove_many(["foo", "nested/baz"])
+
+        state = provider.get_state()
+        self.assertEqual({"bar"}, set(state.files))
+
     def test_case_only_change_movement(self):
         provider = self.get_provider()
 
@@ -272,15 +361,14 @@ class ProviderTestBase(unittest.TestCase):
         provider = self.get_provider()
 
         count = 128
-        for file_idx in range(count):
-            with random_bytes_stream(1024 * 1024) as data_stream:
-                provider.write("file_%s" % file_idx, data_stream)
+        self.create_files(
+            provider, ["file_%s" % idx for idx in range(count)], 1024 * 1024
+        )
 
         state = provider.get_state()
         self.assertEqual(count, len(state.files))
 
-        for file_idx in range(count):
-            provider.remove_file("file_%s" % file_idx)
+        self.remove_files(provider, ["file_%s" % idx for idx in range(count)])
 
         state = provider.get_state()
         self.assertEqual(0, len(state.files))
@@ -314,9 +402,9 @@ class ProviderTestBase(unittest.TestCase):
         state = provider.get_state()
         self.assertEqual({"foo/data", "foo/Data", "Foo/Data"}, set(state.files))
 
-        self.assertEqual(b"data1", stream_to_bytes(provider.read("foo/data")))
-        self.assertEqual(b"data2", stream_to_bytes(provider.read("foo/Data")))
-        self.assertEqual(b"data3", stream_to_bytes(provider.read("Foo/Data")))
+        self.assertEqual(b"data1", read_bytes(provider, "foo/data"))
+        self.assertEqual(b"data2", read_bytes(provider, "foo/Data"))
+        self.assertEqual(b"data3", read_bytes(provider, "Foo/Data"))
 
     def test_two_files_use_different_parent_dir_casing(self):
         provider = self.get_provider()
@@ -345,10 +433,10 @@ class ProviderTestBase(unittest.TestCase):
         with bytes_as_stream(b"data1") as stream:
             provider.write("foo/data1", stream)
 
-        self.assertEqual(b"data1", stream_to_bytes(provider.read("foo/data1")))
-        self.assertEqual(b"data1", stream_to_bytes(provider.read("foo/Data1")))
-        self.assertEqual(b"data1", stream_to_bytes(provider.read("Foo/Data1")))
-        self.assertEqual(b"data1", stream_to_bytes(provider.read("FOO/DATA1")))
+        self.assertEqual(b"data1", read_bytes(provider, "foo/data1"))
+        self.assertEqual(b"data1", read_bytes(provider, "foo/Data1"))
+        self.assertEqual(b"data1", read_bytes(provider, "Foo/Data1"))
+        self.assertEqual(b"data1", read_bytes(provider, "FOO/DATA1"))
 
     def test_move_to_non_existing_directory(self):
         provider = self.get_provider()
@@ -365,7 +453,7 @@ class ProviderTestBase(unittest.TestCase):
 
         paths = [
             "йогурт",
-            "ёшкин-кот"
+            "ёшкин-кот",
             # hello in chinese
             "你好",
             # Dropbox actually does not support emoji in the path and answer with
@@ -378,30 +466,38 @@ class ProviderTestBase(unittest.TestCase):
             "NFC",
         ]
 
-        for path in paths:
-            for write_form in normal_forms:
-                for read_form in normal_forms:
-                    uniq = uuid.uuid4().hex
+        # paths which look the same in both forms (e.g. chinese) would only
+        # repeat the same round-trips, so only distinct pairs are checked
+        cases = {
+            (
+                unicodedata.normalize(write_form, path),
+                unicodedata.normalize(read_form, path),
+            )
+            for path in paths
+            for write_form in normal_forms
+            for read_form in normal_forms
+        }
 
-                    path_in_write_form = unicodedata.normalize(write_form, path)
-                    path_in_read_form = unicodedata.normalize(read_form, path)
+        for path_in_write_form, path_in_read_form in sorted(cases):
+            with self.subTest(
+                write_path=path_in_write_form, read_path=path_in_read_form
+            ):
+                uniq = uuid.uuid4().hex
 
-                    write_path = f"{uniq}/{path_in_write_form}"
-                    read_path = f"{uniq}/{path_in_read_form}"
+                write_path = f"{uniq}/{path_in_write_form}"
+                read_path = f"{uniq}/{path_in_read_form}"
 
-                    with bytes_as_stream(b"whatever") as stream:
-                        provider.write(write_path, stream)
+                with bytes_as_stream(b"whatever") as stream:
+                    provider.write(write_path, stream)
 
-                    read_data = provider.read(read_path).read()
+                read_data = read_bytes(provider, read_path)
 
-                    self.assertEqual(b"whatever", read_data)
+                self.assertEqual(b"whatever", read_data)
 
     def test_remove_folder(self):
         provider = self.get_provider()
 
-        self.create_file(provider, "foo/file1")
-        self.create_file(provider, "foo/file2")
-        self.create_file(provider, "bar/file")
+        self.create_files(provider, ["foo/file1", "foo/file2", "bar/file"])
 
         provider.remove_folder("foo")
 
@@ -422,13 +518,18 @@ class ProviderTestBase(unittest.TestCase):
     def test_remove_folder_nested(self):
         provider = self.get_provider()
 
-        self.create_file(provider, "foo/file1")
-        self.create_file(provider, "foo/file2")
-        self.create_file(provider, "foo/bar/file1")
-        self.create_file(provider, "foo/bar/file2")
-        self.create_file(provider, "foo/bar/spam/file1")
-        self.create_file(provider, "foo/bar/spam/file2")
-        self.create_file(provider, "file")
+        self.create_files(
+            provider,
+            [
+                "foo/file1",
+                "foo/file2",
+                "foo/bar/file1",
+                "foo/bar/file2",
+                "foo/bar/spam/file1",
+                "foo/bar/spam/file2",
+                "file",
+            ],
+        )
 
         provider.remove_folder("foo")
 
@@ -459,14 +560,19 @@ class ProviderTestBase(unittest.TestCase):
     def test_get_state_with_limited_depth(self):
         provider = self.get_provider()
 
-        self.create_file(provider, "file1")
-        self.create_file(provider, "file2")
-        self.create_file(provider, "foo/file1")
-        self.create_file(provider, "foo/file2")
-        self.create_file(provider, "foo/bar/file1")
-        self.create_file(provider, "foo/bar/file2")
-        self.create_file(provider, "bar/file1")
-        self.create_file(provider, "bar/file2")
+        self.create_files(
+            provider,
+            [
+                "file1",
+                "file2",
+                "foo/file1",
+                "foo/file2",
+                "foo/bar/file1",
+                "foo/bar/file2",
+                "bar/file1",
+                "bar/file2",
+            ],
+        )
 
         self.assertEqual(
             {
@@ -489,6 +595,14 @@ class ProviderTestBase(unittest.TestCase):
             set(provider.get_state(depth=2).files),
         )
 
+    def test_get_state_with_zero_depth(self):
+        provider = self.get_provider()
+
+        self.create_files(provider, ["foo", "bar/baz"])
+
+        self.assertEqual({}, provider.get_state(depth=0).files)
+        self.assertEqual({"foo"}, set(provider.get_state(depth=1).files))
+
 
 if __name__ == "__main__":
     unittest.main()
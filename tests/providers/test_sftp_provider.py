@@ -1,14 +1,16 @@
+import hashlib
 import logging
 import os
 import os.path
 import unittest
-import uuid
+import unittest.mock as mock
 
 import pytest
 
+from sync.cache import InMemoryCache
 from sync.core import ProviderBase
 from sync.providers.sftp import STFPProvider
-from tests.common import cleanup_provider
+from tests.common import bytes_as_stream, cleanup_provider, make_remote_root
 from tests.providers.test_provider_base import ProviderTestBase
 
 LOGGER = logging.getLogger(__name__)
@@ -18,7 +20,8 @@ LOGGER = logging.getLogger(__name__)
 class SFTPProviderTest(ProviderTestBase):
     __test__ = True
 
-    def __create_provider(self, root_dir: str) -> STFPProvider:
+    @staticmethod
+    def __create_provider(root_dir: str) -> STFPProvider:
         return STFPProvider(
             root_dir=root_dir,
             host=os.environ["SFTP_HOST"],
@@ -27,15 +30,67 @@ class SFTPProviderTest(ProviderTestBase):
             key_path=os.environ["SFTP_KEY_PATH"],
         )
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # tests use clones sharing a single SSH connection, so that key
+        # exchange and authentication happen once per class
+        cls.base_provider = cls.__create_provider("/tmp/sync-tests")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.base_provider.close()
+        super().tearDownClass()
+
     def setUp(self):
         super().setUp()
-        self.root_dir = "/tmp/sync-tests/%s" % str(uuid.uuid4())
-        self.provider = self.__create_provider(self.root_dir)
+        self.root_dir = make_remote_root("/tmp/sync-tests")
+        self.provider = self.base_provider.clone()
+        self.provider.root_dir = self.root_dir
+        # hashes are cached by relative path, do not let tests see each other
+        self.provider.cache = InMemoryCache()
+        self.addCleanup(self.provider.close)
         self.addCleanup(lambda: cleanup_provider(self.provider))
 
     def get_provider(self) -> ProviderBase:
         return self.provider
 
+    def test_file_hash_is_taken_from_cache_until_file_modified(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        state = self.provider.get_state()
+
+        with mock.patch.object(STFPProvider, "_sha256_files") as patcher:
+            self.assertEqual(state, self.provider.get_state())
+            self.assertEqual(0, patcher.call_count)
+
+        with bytes_as_stream(b"foo-modified") as stream:
+            self.provider.write("foo", stream)
+
+        state = self.provider.get_state()
+        self.assertEqual(
+            hashlib.sha256(b"foo-modified").hexdigest(),
+            state.files["foo"].content_hash,
+        )
+
+    def test_file_hash_is_taken_from_cache_after_move(self):
+        with bytes_as_stream(b"foo") as stream:
+            self.provider.write("foo", stream)
+
+        self.provider.get_state()
+        self.provider.move("foo", "bar/foo")
+
+        # rename preserves modification time, so cached hash is carried over
+        with mock.patch.object(STFPProvider, "_sha256_files") as patcher:
+            state = self.provider.get_state()
+            self.assertEqual(0, patcher.call_count)
+
+        self.assertEqual({"bar/foo"}, set(state.files))
+        self.assertEqual(
+            hashlib.sha256(b"foo").hexdigest(), state.files["bar/foo"].content_hash
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,46 +1,62 @@
-import tempfile
+import os.path
+import shutil
+import sqlite3
 import unittest
+import unittest.mock as mock
 
-from sync.cache import CACHE_MISS, CacheCorruptedError, InMemoryCacheWithStorage
+from sync.cache import (
+    CACHE_MISS,
+    CacheCorruptedError,
+    InMemoryCacheWithStorage,
+    SqliteCache,
+)
+from tests.common import make_temp_dir
+
+VALUES = ["string", 42, 42.42, None, ["foo"], {"nested": "dict"}]
 
 
 class CacheTest(unittest.TestCase):
     def setUp(self):
         super().setUp()
-        self.cache_path = tempfile.mktemp()
+        temp_dir = make_temp_dir()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.cache_path = os.path.join(temp_dir, "cache")
         self.cache = InMemoryCacheWithStorage(self.cache_path)
 
     def test_get_set_delete(self):
-        values = ["string", 42, 42.42, None, ["foo"], {"nested": "dict"}]
-
-        for value in values:
-            self.assertIs(CACHE_MISS, self.cache.get("foo"))
+        for value in VALUES:
+            with self.subTest(value=value):
+                self.assertIs(CACHE_MISS, self.cache.get("foo"))
 
-            self.cache.set("foo", value)
-            self.assertEqual(value, self.cache.get("foo"))
+                self.cache.set("foo", value)
+                self.assertEqual(value, self.cache.get("foo"))
 
-            self.cache.delete("foo")
+                self.cache.delete("foo")
 
     def test_get_set_delete_with_persistence(self):
-        values = ["string", 42, 42.42, None, ["foo"], {"nested": "dict"}]
-
-        for value in values:
-            self.assertIs(CACHE_MISS, self.cache.get("foo"))
+        keys = ["foo_%s" % idx for idx in range(len(VALUES))]
 
-            self.cache.set("foo", value)
+        for key, value in zip(keys, VALUES):
+            self.assertIs(CACHE_MISS, self.cache.get(key))
+            self.cache.set(key, value)
 
-            # save to disk and reload
-            self.cache.save()
-            self.cache.load()
+        # save to disk and reload, once for all the values
+        self.cache.save()
+        self.cache.load()
 
-            self.assertEqual(value, self.cache.get("foo"))
+        for key, value in zip(keys, VALUES):
+            with self.subTest(value=value):
+                self.assertEqual(value, self.cache.get(key))
 
-            self.cache.delete("foo")
+        for key in keys:
+            self.cache.delete(key)
 
-            self.cache.save()
-            self.cache.load()
+        self.cache.save()
+        self.cache.load()
 
-            self.assertIs(CACHE_MISS, self.cache.get("foo"))
+        for key, value in zip(keys, VALUES):
+            with self.subTest(value=value):
+                self.assertIs(CACHE_MISS, self.cache.get(key))
 
     def test_clear(self):
         self.cache.set("foo", "bar")
@@ -84,3 +100,101 @@ class CacheTest(unittest.TestCase):
 
         self.assertEqual("bar", self.cache.get("foo"))
         self.assertEqual("eggs", self.cache.get("spam"))
+
+
+class SqliteCacheTest(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        temp_dir = make_temp_dir()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.cache_path = os.path.join(temp_dir, "cache.sqlite")
+        self.cache = SqliteCache(self.cache_path)
+        self.addCleanup(self.cache.close)
+
+    def test_get_set_delete(self):
+        for value in VALUES:
+            with self.subTest(value=value):
+                self.assertIs(CACHE_MISS, self.cache.get("foo"))
+
+                self.cache.set("foo", value)
+                self.assertEqual(value, self.cache.get("foo"))
+
+                self.cache.delete("foo")
+
+    def test_entries_are_persisted(self):
+        self.cache.set("foo", ("bar", 42))
+        self.cache.set("spam", "eggs")
+        self.cache.delete("spam")
+        self.cache.close()
+
+        other_cache = SqliteCache(self.cache_path)
+        self.addCleanup(other_cache.close)
+
+        self.assertEqual(("bar", 42), other_cache.get("foo"))
+        self.assertIs(CACHE_MISS, other_cache.get("spam"))
+
+    def test_clear(self):
+        self.cache.set("foo", "bar")
+
+        self.cache.clear()
+
+        self.assertIs(CACHE_MISS, self.cache.get("foo"))
+
+    def test_load_corrupted(self):
+        with open(self.cache_path, "w") as f:
+            f.write("corrupted" * 1000)
+
+        self.assertRaises(CacheCorruptedError, self.cache.load)
+
+        self.cache.try_load()
+        self.cache.set("foo", "bar")
+
+        self.assertEqual("bar", self.cache.get("foo"))
+
+    def test_corrupted_database_files_are_removed(self):
+        paths = [self.cache_path + suffix for suffix in ["", "-wal", "-shm"]]
+        for path in paths:
+            with open(path, "wb") as f:
+                f.write(b"corrupted")
+
+        # reopening recreates side files, so only removal itself is checked
+        with mock.patch.object(
+            self.cache, "load", side_effect=[CacheCorruptedError("corrupted"), None]
+        ):
+            self.cache.try_load()
+
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+    def test_damaged_pages_are_detected_on_load(self):
+        for idx in range(1000):
+            self.cache.set("key%d" % idx, "value" * 20)
+        self.cache.close()
+
+        # damage data pages, while the header and the schema stay intact
+        size = os.path.getsize(self.cache_path)
+        with open(self.cache_path, "r+b") as f:
+            f.seek(size // 2)
+            f.write(b"\xff" * 4096)
+
+        self.assertRaises(CacheCorruptedError, self.cache.load)
+
+    def test_unavailable_database_is_not_treated_as_corrupted(self):
+        os.makedirs(self.cache_path)
+
+        self.assertRaises(sqlite3.OperationalError, self.cache.try_load)
+        self.assertTrue(os.path.isdir(self.cache_path))
+
+    def test_failed_recreation_is_logged(self):
+        with mock.patch.object(
+            self.cache,
+            "load",
+            side_effect=[
+                CacheCorruptedError("corrupted"),
+                sqlite3.OperationalError("database is locked"),
+            ],
+        ):
+            with self.assertLogs("sync.cache", level="WARNING") as logs:
+                self.cache.try_load()
+
+        self.assertIn("database is locked", logs.output[-1])
@@ -1,15 +1,20 @@
+import contextlib
+import io
 import logging
 import os.path
+import shutil
 import subprocess
 import sys
-import tempfile
 from unittest import TestCase
 
+from sync.cli import entrypoint
+from tests.common import make_temp_dir
+
 LOGGER = logging.getLogger(__name__)
 
 
 class CliTests(TestCase):
-    def _execute_sync(self, args, expect_success=True):
+    def _execute_sync(self, args, expect_success=True, capture_output=False):
         interpreter_path = os.path.abspath(sys.executable)
 
         args = [
@@ -20,23 +25,63 @@ class CliTests(TestCase):
 
         print("RUNNING: %s" % args)
 
-        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        proc.wait()
+        # flush what was printed so far, otherwise it can show up after output
+        # of the child process which writes into the same descriptors
+        sys.stdout.flush()
+        sys.stderr.flush()
 
-        stdout = proc.stdout.read().decode("utf-8")
-        stderr = proc.stderr.read().decode("utf-8")
+        # unless output is asserted on, child writes straight into inherited
+        # descriptors (which test runner captures anyway), otherwise both pipes
+        # are drained concurrently, so that child never blocks on a full pipe
+        proc = subprocess.run(args, capture_output=capture_output, timeout=300)
 
-        print("STDOUT:\n%s" % stdout)
-        print("STDERR:\n%s" % stderr)
+        if capture_output:
+            print("STDOUT:\n%s" % proc.stdout.decode("utf-8"))
+            print("STDERR:\n%s" % proc.stderr.decode("utf-8"))
 
         if expect_success:
             self.assertEqual(0, proc.returncode)
 
-        return proc.returncode
+        return proc
+
+    def _execute_sync_inprocess(self, args, expect_success=True):
+        """
+        Runs CLI entrypoint inside of the test process, which avoids interpreter
+        startup and imports; returns exit code and combined output.
+        """
+        print("RUNNING IN-PROCESS: %s" % args)
+
+        # entrypoint reconfigures root logger, restore it afterwards
+        root_logger = logging.getLogger()
+        root_handlers = root_logger.handlers[:]
+        root_level = root_logger.level
+
+        buffer = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
+                try:
+                    entrypoint(args)
+                    exit_code = 0
+                except SystemExit as exc:
+                    exit_code = exc.code
+        finally:
+            root_logger.handlers[:] = root_handlers
+            root_logger.setLevel(root_level)
+
+        output = buffer.getvalue()
+        print("OUTPUT:\n%s" % output)
+
+        if expect_success:
+            self.assertEqual(0, exit_code)
 
+        return exit_code, output
+
+    # goes through "python -m sync.cli" to keep the module entrypoint covered
     def test_basic_fs_to_fs_sync(self):
-        source_dir = tempfile.mkdtemp()
-        target_dir = tempfile.mkdtemp()
+        source_dir = make_temp_dir()
+        target_dir = make_temp_dir()
+        self.addCleanup(shutil.rmtree, source_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, target_dir, ignore_errors=True)
 
         with open(os.path.join(source_dir, "foo"), "w") as f:
             f.write("foo")
@@ -53,9 +98,7 @@ class CliTests(TestCase):
                 "FS",
                 "root=%s" % target_dir,
                 "--log-level",
-                # TODO: for some reason on Windows if this is changed to DEBUG
-                #  test never finishes...
-                "INFO",
+                "DEBUG",
             ]
         )
 
@@ -67,3 +110,26 @@ class CliTests(TestCase):
 
         with open(os.path.join(target_dir, "bar"), "r") as f:
             self.assertEqual("bar", f.read())
+
+    def test_dry_run_fs_to_fs_sync(self):
+        source_dir = make_temp_dir()
+        target_dir = make_temp_dir()
+        self.addCleanup(shutil.rmtree, source_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, target_dir, ignore_errors=True)
+
+        with open(os.path.join(source_dir, "foo"), "w") as f:
+            f.write("foo")
+
+        self._execute_sync_inprocess(
+            [
+                "--source",
+                "FS",
+                "root=%s" % source_dir,
+                "--destination",
+                "FS",
+                "root=%s" % target_dir,
+                "--dry-run",
+            ]
+        )
+
+        self.assertFalse(os.path.exists(os.path.join(target_dir, "foo")))
@@ -1,40 +1,51 @@
 import os
-import uuid
 
 import pytest
 
 from sync.core import Syncer
 from sync.providers.dropbox import DropboxProvider
+from tests.common import clone_provider, make_remote_root, requires_dropbox
 from tests.sync.test_sync import SyncTestBase
 
 
 @pytest.mark.dropbox
+@requires_dropbox
 class DropboxToDropboxSyncTest(SyncTestBase):
     __test__ = True
+    parallel_compare = True
 
-    def setUp(self):
-        super().setUp()
-
-        src_provider = DropboxProvider(
-            root_dir="/temp/sync-tests/%s" % uuid.uuid4(),
-            account_id="test_src",
-            token=os.environ["DROPBOX_TOKEN"],
-            app_key=os.environ["DROPBOX_APP_KEY"],
-            app_secret=os.environ["DROPBOX_APP_SECRET"],
-            is_refresh_token=True,
-        )
-        dst_provider = DropboxProvider(
-            root_dir="/temp/sync-tests/%s" % uuid.uuid4(),
-            account_id="test_dst",
+    @staticmethod
+    def __create_provider(root_dir: str, account_id: str) -> DropboxProvider:
+        provider = DropboxProvider(
+            root_dir=root_dir,
+            account_id=account_id,
             token=os.environ["DROPBOX_TOKEN"],
             app_key=os.environ["DROPBOX_APP_KEY"],
             app_secret=os.environ["DROPBOX_APP_SECRET"],
             is_refresh_token=True,
         )
+        # access token is obtained once and then shared by all the clones
+        provider._get_dropbox().check_and_refresh_access_token()
+        return provider
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # one unique prefix per class, tests are told apart by their names
+        cls.class_root_dir = make_remote_root("/temp/sync-tests")
+
+        cls.src_base_provider = cls.__create_provider(cls.class_root_dir, "test_src")
+        cls.dst_base_provider = cls.__create_provider(cls.class_root_dir, "test_dst")
+
+    def setUp(self):
+        super().setUp()
+
+        test_root_dir = "%s/%s" % (self.class_root_dir, self._testMethodName)
 
         self._syncer = Syncer(
-            src_provider,
-            dst_provider,
+            clone_provider(self.src_base_provider, "%s/src" % test_root_dir),
+            clone_provider(self.dst_base_provider, "%s/dst" % test_root_dir),
         )
 
     @property
@@ -1,38 +1,62 @@
 import os
-import uuid
 
 import pytest
 
 from sync.core import Syncer
 from sync.providers.dropbox import DropboxProvider
 from sync.providers.sftp import STFPProvider
+from tests.common import clone_provider, make_remote_root, requires_dropbox
 from tests.sync.test_sync import SyncTestBase
 
 
 @pytest.mark.dropbox
+@requires_dropbox
 @pytest.mark.sftp
 class DropboxToSftpSyncTest(SyncTestBase):
     __test__ = True
+    parallel_compare = True
 
-    def setUp(self):
-        super().setUp()
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
 
-        src_provider = DropboxProvider(
-            root_dir="/temp/sync-tests/%s" % uuid.uuid4(),
+        # tests use clones, so that access token, connection pool and SSH
+        # connection are set up once per class
+        cls.src_base_provider = DropboxProvider(
+            root_dir="/temp/sync-tests",
             account_id="test",
             token=os.environ["DROPBOX_TOKEN"],
             app_key=os.environ["DROPBOX_APP_KEY"],
             app_secret=os.environ["DROPBOX_APP_SECRET"],
             is_refresh_token=True,
         )
-        dst_provider = STFPProvider(
-            root_dir="/tmp/sync-tests/%s" % uuid.uuid4(),
+        cls.src_base_provider._get_dropbox().check_and_refresh_access_token()
+
+        cls.dst_base_provider = STFPProvider(
+            root_dir="/tmp/sync-tests",
             host=os.environ["SFTP_HOST"],
             port=int(os.environ["SFTP_PORT"]),
             username=os.environ["SFTP_USERNAME"],
             key_path=os.environ["SFTP_KEY_PATH"],
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        cls.dst_base_provider.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+
+        src_provider = clone_provider(
+            self.src_base_provider, make_remote_root("/temp/sync-tests")
+        )
+
+        dst_provider = clone_provider(
+            self.dst_base_provider, make_remote_root("/tmp/sync-tests")
+        )
+        self.addCleanup(dst_provider.close)
+
         self._syncer = Syncer(
             src_provider,
             dst_provider,
@@ -1,53 +1,61 @@
+import os
 import shutil
-import tempfile
 from unittest import TestCase
 
 from sync.core import Syncer
-from sync.provider import ProviderBase
 from sync.providers.fs import FSProvider
-from tests.common import random_bytes_stream
+from tests.common import make_temp_dir
 
 
 class FiltersTest(TestCase):
     __test__ = True
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # tests do not modify the source, so it is populated once per class
+        cls.src_dir = make_temp_dir()
+        cls.addClassCleanup(shutil.rmtree, cls.src_dir, ignore_errors=True)
+
+        # the files only need to be on disk for the sync to discover them,
+        # so there is no need to go through the provider; only paths are
+        # checked, so content is the same tiny payload for all of them
+        for path in [
+            "foo.file",
+            "foo/foo.file",
+            "foo/bar.file",
+            "bar.file",
+            "bar/foo.file",
+            "bar/bar.file",
+            "spam.file",
+            "spam/spam.file",
+            "spam/foo/file",
+            "spam/bar/file",
+        ]:
+            full_path = os.path.join(cls.src_dir, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(b"0")
+
     def setUp(self):
         super().setUp()
 
-        src_dir = tempfile.mkdtemp()
-        dst_dir = tempfile.mkdtemp()
+        dst_dir = make_temp_dir()
+        self.addCleanup(shutil.rmtree, dst_dir, ignore_errors=True)
 
-        src_provider = FSProvider(root_dir=src_dir)
+        src_provider = FSProvider(root_dir=self.src_dir)
         dst_provider = FSProvider(root_dir=dst_dir)
 
-        self.addCleanup(lambda: shutil.rmtree(src_dir))
-        self.addCleanup(lambda: shutil.rmtree(dst_dir))
-
         self._syncer = Syncer(
             src_provider,
             dst_provider,
         )
 
-        # common setup
-        self.write_by_path(src_provider, "foo.file")
-        self.write_by_path(src_provider, "foo/foo.file")
-        self.write_by_path(src_provider, "foo/bar.file")
-        self.write_by_path(src_provider, "bar.file")
-        self.write_by_path(src_provider, "bar/foo.file")
-        self.write_by_path(src_provider, "bar/bar.file")
-        self.write_by_path(src_provider, "spam.file")
-        self.write_by_path(src_provider, "spam/spam.file")
-        self.write_by_path(src_provider, "spam/foo/file")
-        self.write_by_path(src_provider, "spam/bar/file")
-
-    def write_by_path(self, provider: ProviderBase, path: str):
-        with random_bytes_stream() as stream:
-            provider.write(path, stream)
-
     def sync_and_verify_expected_files(self, expected_paths):
         self._syncer.sync()
         state = self._syncer.dst_provider.get_state()
-        self.assertCountEqual(expected_paths, state.files.keys())
+        self.assertEqual(set(expected_paths), set(state.files.keys()))
 
     def test_single_filter_expression(self):
         self._syncer.filter = "foo/*"
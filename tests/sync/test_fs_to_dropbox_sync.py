@@ -1,33 +1,47 @@
 import os
-import tempfile
-import uuid
 
 import pytest
 
 from sync.core import Syncer
 from sync.providers.dropbox import DropboxProvider
 from sync.providers.fs import FSProvider
+from tests.common import (
+    clone_provider,
+    make_remote_root,
+    make_temp_dir,
+    requires_dropbox,
+)
 from tests.sync.test_sync import SyncTestBase
 
 
 @pytest.mark.dropbox
+@requires_dropbox
 class FsToDropboxSyncTest(SyncTestBase):
     __test__ = True
+    parallel_compare = True
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # tests use clones, so that access token and connection pool are shared
+        cls.dst_base_provider = DropboxProvider(
+            root_dir="/temp/sync-tests",
+            account_id="test",
+            token=os.environ["DROPBOX_TOKEN"],
+            app_key=os.environ["DROPBOX_APP_KEY"],
+            app_secret=os.environ["DROPBOX_APP_SECRET"],
+            is_refresh_token=True,
+        )
+        cls.dst_base_provider._get_dropbox().check_and_refresh_access_token()
 
     def setUp(self):
         super().setUp()
 
-        src_dir = tempfile.mkdtemp()
+        src_dir = make_temp_dir()
         src_provider = FSProvider(root_dir=src_dir)
 
-        root_dir = "/temp/sync-tests/%s" % uuid.uuid4()
-        dst_provider = DropboxProvider(
-            root_dir=root_dir,
-            account_id="test",
-            token=os.environ["DROPBOX_TOKEN"],
-            app_key=os.environ["DROPBOX_APP_KEY"],
-            app_secret=os.environ["DROPBOX_APP_SECRET"],
-            is_refresh_token=True,
+        dst_provider = clone_provider(
+            self.dst_base_provider, make_remote_root("/temp/sync-tests")
         )
 
         self._syncer = Syncer(
@@ -1,7 +1,6 @@
-import tempfile
-
 from sync.core import Syncer
 from sync.providers.fs import FSProvider
+from tests.common import make_temp_dir
 from tests.sync.test_sync import SyncTestBase
 
 
@@ -11,8 +10,8 @@ class FsToFsSyncTest(SyncTestBase):
     def setUp(self):
         super().setUp()
 
-        src_dir = tempfile.mkdtemp()
-        dst_dir = tempfile.mkdtemp()
+        src_dir = make_temp_dir()
+        dst_dir = make_temp_dir()
 
         src_provider = FSProvider(root_dir=src_dir)
         dst_provider = FSProvider(root_dir=dst_dir)
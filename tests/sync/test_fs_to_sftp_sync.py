@@ -1,33 +1,47 @@
 import os
-import tempfile
-import uuid
 
 import pytest
 
 from sync.core import Syncer
 from sync.providers.fs import FSProvider
 from sync.providers.sftp import STFPProvider
+from tests.common import clone_provider, make_remote_root, make_temp_dir
 from tests.sync.test_sync import SyncTestBase
 
 
 @pytest.mark.sftp
 class FsToSftpSyncTest(SyncTestBase):
     __test__ = True
+    parallel_compare = True
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # tests use clones sharing SSH connection, so that key exchange and
+        # authentication happen once per class
+        cls.dst_base_provider = STFPProvider(
+            root_dir="/tmp/sync-tests",
+            host=os.environ["SFTP_HOST"],
+            port=int(os.environ["SFTP_PORT"]),
+            username=os.environ["SFTP_USERNAME"],
+            key_path=os.environ["SFTP_KEY_PATH"],
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dst_base_provider.close()
+        super().tearDownClass()
 
     def setUp(self):
         super().setUp()
 
-        src_dir = tempfile.mkdtemp()
+        src_dir = make_temp_dir()
         src_provider = FSProvider(root_dir=src_dir)
 
-        root_dir = "/tmp/sync-tests/%s" % uuid.uuid4()
-        dst_provider = STFPProvider(
-            root_dir=root_dir,
-            host=os.environ["SFTP_HOST"],
-            port=int(os.environ["SFTP_PORT"]),
-            username=os.environ["SFTP_USERNAME"],
-            key_path=os.environ["SFTP_KEY_PATH"],
+        dst_provider = clone_provider(
+            self.dst_base_provider, make_remote_root("/tmp/sync-tests")
         )
+        self.addCleanup(dst_provider.close)
 
         self._syncer = Syncer(
             src_provider,
@@ -1,37 +1,54 @@
 import os
-import uuid
 
 import pytest
 
 from sync.core import Syncer
 from sync.providers.sftp import STFPProvider
+from tests.common import clone_provider, make_remote_root
 from tests.sync.test_sync import SyncTestBase
 
 
 @pytest.mark.sftp
 class SftpToSftpSyncTest(SyncTestBase):
     __test__ = True
+    parallel_compare = True
 
-    def setUp(self):
-        super().setUp()
-
-        src_dir = "/tmp/sync-tests/%s" % uuid.uuid4()
-        src_provider = STFPProvider(
-            root_dir=src_dir,
+    @staticmethod
+    def __create_provider() -> STFPProvider:
+        return STFPProvider(
+            root_dir="/tmp/sync-tests",
             host=os.environ["SFTP_HOST"],
             port=int(os.environ["SFTP_PORT"]),
             username=os.environ["SFTP_USERNAME"],
             key_path=os.environ["SFTP_KEY_PATH"],
         )
 
-        dst_dir = "/tmp/sync-tests/%s" % uuid.uuid4()
-        dst_provider = STFPProvider(
-            root_dir=dst_dir,
-            host=os.environ["SFTP_HOST"],
-            port=int(os.environ["SFTP_PORT"]),
-            username=os.environ["SFTP_USERNAME"],
-            key_path=os.environ["SFTP_KEY_PATH"],
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # tests use clones sharing SSH connections, so that key exchange and
+        # authentication happen once per class
+        cls.src_base_provider = cls.__create_provider()
+        cls.dst_base_provider = cls.__create_provider()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.src_base_provider.close()
+        cls.dst_base_provider.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+
+        src_provider = clone_provider(
+            self.src_base_provider, make_remote_root("/tmp/sync-tests")
+        )
+        self.addCleanup(src_provider.close)
+
+        dst_provider = clone_provider(
+            self.dst_base_provider, make_remote_root("/tmp/sync-tests")
         )
+        self.addCleanup(dst_provider.close)
 
         self._syncer = Syncer(
             src_provider,
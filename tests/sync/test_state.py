@@ -0,0 +1,93 @@
+import io
+import pickle
+import unittest
+
+from sync.hashing import HashType
+from sync.state import FileState, StorageState, SyncPairState
+
+# SyncPairState pickled before FileState started to use slots
+LEGACY_STATE_BYTES = (
+    b"\x80\x04\x95\xf6\x00\x00\x00\x00\x00\x00\x00\x8c\nsync.state\x94\x8c\r"
+    b"SyncPairState\x94\x93\x94)\x81\x94}\x94(\x8c\x0csource_state\x94h\x00\x8c"
+    b"\x0cStorageState\x94\x93\x94)\x81\x94}\x94\x8c\x05files\x94}\x94\x8c\x03"
+    b"foo\x94h\x00\x8c\tFileState\x94\x93\x94)\x81\x94}\x94(\x8c\x04path\x94h"
+    b"\x0c\x8c\x0ccontent_hash\x94\x8c\x03abc\x94\x8c\thash_type\x94\x8c\x0c"
+    b"sync.hashing\x94\x8c\x08HashType\x94\x93\x94\x8c\x06SHA256\x94\x85\x94R"
+    b"\x94\x8c\x08revision\x94\x8c\x011\x94ubssb\x8c\ndest_state\x94h\x07)\x81"
+    b"\x94}\x94h\n}\x94sbub."
+)
+
+
+class SyncPairStateTest(unittest.TestCase):
+    def test_save_load(self):
+        state = SyncPairState(
+            StorageState(
+                {
+                    "foo": FileState("foo", "abc", HashType.SHA256, "1"),
+                }
+            ),
+            StorageState(
+                {
+                    "foo": FileState("foo", "def", HashType.DROPBOX_SHA256),
+                }
+            ),
+        )
+
+        with io.BytesIO() as buffer:
+            state.save(buffer)
+            buffer.seek(0)
+            loaded_state = SyncPairState.load(buffer)
+
+        self.assertEqual(state.source_state, loaded_state.source_state)
+        self.assertEqual(state.dest_state, loaded_state.dest_state)
+
+    def test_load_legacy_state(self):
+        with io.BytesIO(LEGACY_STATE_BYTES) as buffer:
+            loaded_state = SyncPairState.load(buffer)
+
+        self.assertEqual(
+            StorageState(
+                {
+                    "foo": FileState("foo", "abc", HashType.SHA256, "1"),
+                }
+            ),
+            loaded_state.source_state,
+        )
+        self.assertEqual(StorageState(), loaded_state.dest_state)
+
+    def test_file_state_has_no_instance_dict(self):
+        file_state = FileState("foo", "abc", HashType.SHA256)
+        self.assertFalse(hasattr(file_state, "__dict__"))
+        self.assertEqual(file_state, pickle.loads(pickle.dumps(file_state)))
+
+    def test_loaded_strings_are_shared(self):
+        state = SyncPairState(
+            StorageState(
+                {
+                    "dir/foo": FileState("dir/Foo", "abc" * 3, HashType.SHA256),
+                }
+            ),
+            StorageState(
+                {
+                    "dir/foo": FileState("dir/Foo", "abc" * 3, HashType.SHA256),
+                }
+            ),
+        )
+
+        with io.BytesIO() as buffer:
+            state.save(buffer)
+            buffer.seek(0)
+            loaded_state = SyncPairState.load(buffer)
+
+        source = loaded_state.source_state.files["dir/foo"]
+        dest = loaded_state.dest_state.files["dir/foo"]
+        self.assertIs(source.path, dest.path)
+        self.assertIs(source.content_hash, dest.content_hash)
+        self.assertIs(
+            next(iter(loaded_state.source_state.files)),
+            next(iter(loaded_state.dest_state.files)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
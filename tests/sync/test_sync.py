@@ -1,6 +1,9 @@
 import abc
+import concurrent.futures
 import os.path
-from unittest import TestCase
+import threading
+from typing import List, Tuple
+from unittest import TestCase, mock
 
 import pytest
 
@@ -15,21 +18,29 @@ from sync.core import (
     Syncer,
     SyncError,
     UploadSyncAction,
+    compare_files,
     filter_state,
     make_filter,
 )
 from sync.provider import ProviderBase
+from sync.state import FileState, StorageState
 from tests.common import (
     bytes_as_stream,
     cleanup_provider,
     random_bytes_stream,
-    stream_to_bytes,
+    read_bytes,
 )
 
+COMPARE_THREADS = 8
+
 
 class SyncTestBase(TestCase):
     __test__ = False
 
+    # comparison with remote providers is dominated by waiting on the network,
+    # so subclasses with such providers compare files concurrently
+    parallel_compare = False
+
     @property
     @abc.abstractmethod
     def syncer(self) -> Syncer:
@@ -40,16 +51,23 @@ class SyncTestBase(TestCase):
 
         state_file_path = self.syncer.get_state_file_path()
 
-        if os.path.exists(state_file_path):
+        try:
             os.remove(state_file_path)
+        except FileNotFoundError:
+            pass
 
         # cleanup providers
         cleanup_provider(self.syncer.src_provider)
         cleanup_provider(self.syncer.dst_provider)
 
-    def ensure_same_state(self):
+    def ensure_same_state(self) -> Tuple[StorageState, StorageState]:
+        """
+        Returns source and destination states which were compared, so that
+        callers can inspect them without listing providers again.
+        """
         src_state = self.syncer.src_provider.get_state()
         dst_state = self.syncer.dst_provider.get_state()
+        result = (src_state, dst_state)
 
         # consider the filter if defined
         if self.syncer.filter:
@@ -63,27 +81,79 @@ class SyncTestBase(TestCase):
         # ensure same file lists
         # note that we can not directly compare different providers StorageState
         # as the content hash is abstract and can mean different things
-        self.assertEqual(set(src_state.files), set(dst_state.files))
-
-        for normalized_path in src_state.files:
-            source_file_state = src_state.files[normalized_path]
-            destination_file_state = dst_state.files[normalized_path]
-            self.assertTrue(
-                self.syncer.compare_files(
-                    src_path=source_file_state.path,
-                    dst_path=destination_file_state.path,
-                ),
-                f'files are different by path "{normalized_path}"',
+        src_files = src_state.files
+        dst_files = dst_state.files
+        self.assertEqual(src_files.keys(), dst_files.keys())
+
+        # file states from the listing are fresh, so these are compared instead
+        # of fetching them again file by file; when both states carry hash of
+        # the same type comparison does not need to reach the providers at all
+        normalized_paths = list(src_files)
+        state_pairs = [(src_files[path], dst_files[path]) for path in normalized_paths]
+
+        if self.parallel_compare:
+            results = self.compare_files_concurrently(state_pairs)
+        else:
+            results = [
+                compare_files(
+                    src_file_state,
+                    dst_file_state,
+                    self.syncer.src_provider,
+                    self.syncer.dst_provider,
+                )
+                for src_file_state, dst_file_state in state_pairs
+            ]
+
+        for normalized_path, is_same in zip(normalized_paths, results):
+            self.assertTrue(is_same, f'files are different by path "{normalized_path}"')
+
+        return result
+
+    def compare_files_concurrently(
+        self, state_pairs: List[Tuple[FileState, FileState]]
+    ) -> List[bool]:
+        # providers are not thread-safe, so each worker uses its own clones
+        thread_local = threading.local()
+        clones: List[ProviderBase] = []
+
+        def compare(state_pair: Tuple[FileState, FileState]) -> bool:
+            if not hasattr(thread_local, "providers"):
+                thread_local.providers = (
+                    self.syncer.src_provider.clone(),
+                    self.syncer.dst_provider.clone(),
+                )
+                clones.extend(thread_local.providers)
+            src_provider, dst_provider = thread_local.providers
+            src_file_state, dst_file_state = state_pair
+            return compare_files(
+                src_file_state,
+                dst_file_state,
+                src_provider,
+                dst_provider,
             )
 
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=COMPARE_THREADS
+            ) as executor:
+                return list(executor.map(compare, state_pairs))
+        finally:
+            for clone in clones:
+                clone.close()
+
     def do_sync(self, expected_sync_actions=None, ensure_same_state=True):
         sync_actions = self.syncer.sync()
 
         if expected_sync_actions is not None:
-            self.assertCountEqual(expected_sync_actions, sync_actions)
+            # there is at most one action per path, so sets lose nothing; type
+            # is a part of the key as action equality only considers paths
+            self.assertEqual(
+                {(action.TYPE, action) for action in expected_sync_actions},
+                {(action.TYPE, action) for action in sync_actions},
+            )
 
         if ensure_same_state:
-            self.ensure_same_state()
+            return self.ensure_same_state()
 
     def create_file(self, provider: ProviderBase, path: str):
         with random_bytes_stream(1024) as stream:
@@ -93,31 +163,31 @@ class SyncTestBase(TestCase):
         src_provider = self.syncer.src_provider
         dst_provider = self.syncer.dst_provider
 
-        self.do_sync(expected_sync_actions=[])
+        _, dst_state = self.do_sync(expected_sync_actions=[])
 
-        self.assertEqual(0, len(dst_provider.get_state().files))
+        self.assertEqual(0, len(dst_state.files))
 
         with bytes_as_stream(b"data") as stream:
             src_provider.write("foo", stream)
 
-        self.do_sync(expected_sync_actions=[UploadSyncAction("foo")])
+        _, dst_state = self.do_sync(expected_sync_actions=[UploadSyncAction("foo")])
 
-        self.assertEqual(1, len(dst_provider.get_state().files))
+        self.assertEqual(1, len(dst_state.files))
 
         with bytes_as_stream(b"data") as stream:
             src_provider.write("bar", stream)
 
-        self.do_sync([UploadSyncAction("bar")])
+        _, dst_state = self.do_sync([UploadSyncAction("bar")])
 
-        self.assertEqual(2, len(dst_provider.get_state().files))
+        self.assertEqual(2, len(dst_state.files))
 
         # add file on destination
         with bytes_as_stream(b"data") as stream:
             dst_provider.write("baz", stream)
 
-        self.do_sync(expected_sync_actions=[DownloadSyncAction("baz")])
+        src_state, _ = self.do_sync(expected_sync_actions=[DownloadSyncAction("baz")])
 
-        self.assertEqual(3, len(src_provider.get_state().files))
+        self.assertEqual(3, len(src_state.files))
 
     def test_sync_updated_files(self):
         src_provider = self.syncer.src_provider
@@ -128,14 +198,14 @@ class SyncTestBase(TestCase):
 
         self.do_sync([UploadSyncAction("foo")])
 
-        self.assertEqual(b"data", stream_to_bytes(dst_provider.read("foo")))
+        self.assertEqual(b"data", read_bytes(dst_provider, "foo"))
 
         with bytes_as_stream(b"updated") as stream:
             src_provider.write("foo", stream)
 
         self.do_sync([UploadSyncAction("foo")])
 
-        self.assertEqual(b"updated", stream_to_bytes(dst_provider.read("foo")))
+        self.assertEqual(b"updated", read_bytes(dst_provider, "foo"))
 
     def test_sync_deleted_files(self):
         src_provider = self.syncer.src_provider
@@ -147,34 +217,65 @@ class SyncTestBase(TestCase):
         with bytes_as_stream(b"data") as stream:
             src_provider.write("bar", stream)
 
-        self.do_sync(
+        _, dst_state = self.do_sync(
             [
                 UploadSyncAction("foo"),
                 UploadSyncAction("bar"),
             ]
         )
 
-        self.assertEqual(2, len(dst_provider.get_state().files))
+        self.assertEqual(2, len(dst_state.files))
 
         src_provider.remove_file("foo")
 
-        self.do_sync(
+        _, dst_state = self.do_sync(
             [
                 RemoveOnDestinationSyncAction("foo"),
             ]
         )
 
-        self.assertEqual(1, len(dst_provider.get_state().files))
+        self.assertEqual(1, len(dst_state.files))
 
         dst_provider.remove_file("bar")
 
-        self.do_sync(
+        _, dst_state = self.do_sync(
             [
                 RemoveOnSourceSyncAction("bar"),
             ]
         )
 
-        self.assertEqual(0, len(dst_provider.get_state().files))
+        self.assertEqual(0, len(dst_state.files))
+
+    def test_removals_are_applied_in_batch(self):
+        src_provider = self.syncer.src_provider
+        dst_provider = self.syncer.dst_provider
+
+        for path in ["foo", "bar", "baz"]:
+            with bytes_as_stream(b"data") as stream:
+                src_provider.write(path, stream)
+
+        self.do_sync()
+
+        for path in ["foo", "bar", "baz"]:
+            src_provider.remove_file(path)
+
+        # actions are applied by the provider clones
+        provider_type = type(dst_provider)
+        with mock.patch.object(
+            provider_type,
+            "remove_many",
+            autospec=True,
+            side_effect=provider_type.remove_many,
+        ) as patcher:
+            self.do_sync(
+                [
+                    RemoveOnDestinationSyncAction("foo"),
+                    RemoveOnDestinationSyncAction("bar"),
+                    RemoveOnDestinationSyncAction("baz"),
+                ]
+            )
+
+        self.assertEqual(1, patcher.call_count)
 
     def test_sync_moved_files(self):
         src_provider = self.syncer.src_provider
@@ -183,27 +284,27 @@ class SyncTestBase(TestCase):
         with bytes_as_stream(b"data") as stream:
             src_provider.write("foo", stream)
 
-        self.do_sync(
+        _, dst_state = self.do_sync(
             [
                 UploadSyncAction("foo"),
             ]
         )
 
-        self.assertEqual(1, len(dst_provider.get_state().files))
+        self.assertEqual(1, len(dst_state.files))
 
         # move the file on source
         src_provider.move("foo", "bar")
 
-        self.do_sync([MoveOnDestinationSyncAction("foo", "bar")])
+        _, dst_state = self.do_sync([MoveOnDestinationSyncAction("foo", "bar")])
 
-        self.assertEqual(1, len(dst_provider.get_state().files))
+        self.assertEqual(1, len(dst_state.files))
 
         # move the file on destination
         dst_provider.move("bar", "baz")
 
-        self.do_sync([MoveOnSourceSyncAction("bar", "baz")])
+        _, dst_state = self.do_sync([MoveOnSourceSyncAction("bar", "baz")])
 
-        self.assertEqual(1, len(dst_provider.get_state().files))
+        self.assertEqual(1, len(dst_state.files))
 
     def test_conflicting_updates(self):
         src_provider = self.syncer.src_provider
@@ -243,12 +344,17 @@ class SyncTestBase(TestCase):
     def test_limited_depth(self):
         src_provider = self.syncer.src_provider
 
-        with random_bytes_stream() as stream:
-            src_provider.write("file1", stream)
-            src_provider.write("foo/file1", stream)
-            src_provider.write("foo/file2", stream)
-            src_provider.write("foo/bar/file1", stream)
-            src_provider.write("foo/bar/file2", stream)
+        # every file needs its own stream, as writing consumes it
+        data = os.urandom(1024)
+        for path in [
+            "file1",
+            "foo/file1",
+            "foo/file2",
+            "foo/bar/file1",
+            "foo/bar/file2",
+        ]:
+            with bytes_as_stream(data) as stream:
+                src_provider.write(path, stream)
 
         # normally depth is set in the constructor, but it is okay currently
         # to modify it for simplicity